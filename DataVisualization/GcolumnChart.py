@@ -1,7 +1,6 @@
 import simpy
 import numpy as np
 from tabulate import tabulate
-import matplotlib.pyplot as plt
 
 # Define constants
 NUM_WORKSTATIONS = 6
@@ -15,8 +14,10 @@ FIXING_TIME_MEAN = 3
 WORK_TIME_MEAN = 4
 
 class ManufacturingFacility:
-    def __init__(self, env):
+    def __init__(self, env, exporter=None, seed=None):
         self.env = env
+        self.rng = np.random.default_rng(seed)
+        self.exporter = exporter
         self.workstations = [simpy.Resource(env) for _ in range(NUM_WORKSTATIONS)]
         self.bins = [BIN_CAPACITY for _ in range(NUM_BINS)]
         self.supplier_device = simpy.Resource(env)
@@ -24,41 +25,57 @@ class ManufacturingFacility:
         self.total_fixing_time = 0
         self.total_production_delay = 0
         self.total_quality_failures = 0
-        self.downtime = [0] * NUM_WORKSTATIONS
+        self.downtime = np.zeros(NUM_WORKSTATIONS, dtype=int)  # Failure count
+        # Time spent in each state, added up as the timeouts are taken
+        self.busy_time = np.zeros(NUM_WORKSTATIONS)
+        self.down_time = np.zeros(NUM_WORKSTATIONS)
+        self.supplier_busy_time = 0.0
+        self.visits = np.zeros(NUM_WORKSTATIONS, dtype=int)
+        self.delay = np.zeros(NUM_WORKSTATIONS)  # Time at the station beyond the nominal work time
 
     def production_process(self):
         while True:
             # Check for accidents
-            if np.random.random() < ACCIDENT_PROBABILITY:
+            if self.rng.random() < ACCIDENT_PROBABILITY:
                 yield self.env.timeout(1)  # Stop production for 1 time unit
                 continue
             
             # Get a bin of raw material
             with self.supplier_device.request() as req:
                 yield req
-                bin_index = np.random.randint(NUM_BINS)
+                bin_index = self.rng.integers(NUM_BINS)
                 yield self.env.timeout(1)  # Resupply time
+                self.supplier_busy_time += 1
                 self.bins[bin_index] = BIN_CAPACITY
             
             # Start production process
             start_time = self.env.now
             for i in range(NUM_WORKSTATIONS):
+                entry_time = self.env.now
                 # Check if the workstation fails
-                if np.random.random() < FAILURE_PROBABILITIES[i]:
+                if self.rng.random() < FAILURE_PROBABILITIES[i]:
                     self.downtime[i] += 1
-                    fixing_time = max(np.random.exponential(FIXING_TIME_MEAN), 0)  # Ensure non-negative fixing time
+                    if self.exporter is not None:
+                        self.exporter.record(self.env.now, i + 1, "failure", 1)
+                    fixing_time = max(self.rng.exponential(FIXING_TIME_MEAN), 0)  # Ensure non-negative fixing time
                     yield self.env.timeout(fixing_time)
+                    self.down_time[i] += fixing_time
                 
                 # Use a bin of raw material
                 self.bins[bin_index] -= 1
                 
                 # Process time at the workstation
-                work_time = max(np.random.normal(WORK_TIME_MEAN), 0)  # Ensure non-negative work time
+                work_time = max(self.rng.normal(WORK_TIME_MEAN), 0)  # Ensure non-negative work time
                 yield self.env.timeout(work_time)
+                self.busy_time[i] += work_time
+                self.visits[i] += 1
+                self.delay[i] += self.env.now - entry_time - WORK_TIME_MEAN
                 
                 # Check for quality issues
-                if i == NUM_WORKSTATIONS - 1 and np.random.random() < REJECTION_PROBABILITY:
+                if i == NUM_WORKSTATIONS - 1 and self.rng.random() < REJECTION_PROBABILITY:
                     self.total_quality_failures += 1
+                    if self.exporter is not None:
+                        self.exporter.record(self.env.now, i + 1, "rejected", 1)
                     break
                 
                 # Move to the next workstation
@@ -71,23 +88,45 @@ class ManufacturingFacility:
             
             # Update production count
             self.production_count += 1
+            if self.exporter is not None:
+                self.exporter.record(self.env.now, NUM_WORKSTATIONS, "produced", production_time)
             
             if self.production_count >= PRODUCTION_TIME:
                 break
 
-# Simulation function
-def simulate():
+def run(seed, exporter=None):
     env = simpy.Environment()
-    facility = ManufacturingFacility(env)
+    facility = ManufacturingFacility(env, exporter, seed=seed)
     env.process(facility.production_process())
     env.run()
+    return facility, {
+        "production": facility.production_count,
+        "quality_failures": facility.total_quality_failures,
+        "production_delay": facility.total_production_delay,
+        "downtime": facility.downtime.tolist(),
+        "fixing_time": facility.down_time.tolist(),
+        "occupancy": facility.busy_time.tolist(),
+    }
+
+# Simulation function
+def simulate(exporter=None, seed=None):
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    facility, result = run(seed, exporter)
+    env = facility.env
 
     # Calculate and return all metrics
     final_production = facility.production_count
-    occupancy_per_station = [(PRODUCTION_TIME - downtime) / PRODUCTION_TIME for downtime in facility.downtime]
+    occupancy_per_station = facility.busy_time / env.now
+    if exporter is not None:
+        exporter.write_aggregates({
+            "station": list(range(1, NUM_WORKSTATIONS + 1)),
+            "downtime": facility.downtime.tolist(),
+            "occupancy": occupancy_per_station.tolist(),
+        })
     downtime_per_station = facility.downtime
-    occupancy_supplier_device = facility.supplier_device.count / PRODUCTION_TIME
-    average_fixing_time = sum(facility.downtime) / sum(FAILURE_PROBABILITIES)
+    occupancy_supplier_device = facility.supplier_busy_time / env.now
+    average_fixing_time = facility.down_time.sum() / max(facility.downtime.sum(), 1)
     average_delay_production = facility.total_production_delay / facility.production_count
     average_faulty_products = facility.total_quality_failures / facility.production_count
 
@@ -102,7 +141,7 @@ def simulate():
 
     # Prepare tables
     workstation_table = [[f"Workstation {i+1}", downtime_per_station[i]] for i in range(NUM_WORKSTATIONS)]
-    total_table = [["Total", sum(downtime_per_station)]]
+    total_table = [["Total", downtime_per_station.sum()]]
 
     # Print tables
     print("\nWorkstation Metrics:")
@@ -112,8 +151,8 @@ def simulate():
 
     # Prepare data for charts
     machines = ['Machine 1', 'Machine 2', 'Machine 3', 'Machine 4', 'Machine 5', 'Machine 6']
-    average_fixing_time_per_machine = [np.random.uniform(1, 5) for _ in range(NUM_WORKSTATIONS)]
-    average_delay_per_machine = [np.random.uniform(0, 2) for _ in range(NUM_WORKSTATIONS)]
+    average_fixing_time_per_machine = facility.down_time / np.maximum(facility.downtime, 1)
+    average_delay_per_machine = facility.delay / np.maximum(facility.visits, 1)
 
     # Set the width of the bars
     barWidth = 0.35
@@ -122,6 +161,8 @@ def simulate():
     r1 = np.arange(len(average_fixing_time_per_machine))
     r2 = [x + barWidth for x in r1]
 
+    import matplotlib.pyplot as plt  # Imported lazily, only needed for the charts
+
     # Make the plot
     plt.figure(figsize=(10, 6))
     plt.bar(r1, average_fixing_time_per_machine, color='b', width=barWidth, edgecolor='grey', label='Average Fixing Time')
@@ -135,11 +176,12 @@ def simulate():
     plt.legend()
     plt.title('Machine Performance Metrics')
     plt.show()
+    return seed, result
 
 # Main function
-def main():
+def main(seed=None):
     # Run simulation
-    simulate()
+    return simulate(seed=seed)
 
 if __name__ == "__main__":
     main()
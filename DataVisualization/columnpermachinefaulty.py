@@ -1,35 +1,49 @@
 import simpy
 import numpy as np
-import matplotlib.pyplot as plt
 
 # Define constants
 NUM_WORKSTATIONS = 6
 FAILURE_PROBABILITIES = [0.20, 0.10, 0.15, 0.05, 0.07, 0.10]
 SIMULATION_TIME = 5000
 
+def failure_ticks(rng, probability, horizon=SIMULATION_TIME):
+    # Ticks with a failure, drawn as geometric gaps instead of one draw per tick
+    tick = int(rng.geometric(probability)) - 1
+    while tick < horizon:
+        yield tick
+        tick += int(rng.geometric(probability))
+
 class ManufacturingFacility:
-    def __init__(self, env):
+    def __init__(self, env, seed=None):
         self.env = env
-        self.total_faulty_production = [0] * NUM_WORKSTATIONS
-
-    def production_process(self):
-        while True:
-            for i in range(NUM_WORKSTATIONS):
-                if np.random.random() < FAILURE_PROBABILITIES[i]:
-                    self.total_faulty_production[i] += 1  # Increment faulty production count
+        self.rng = np.random.default_rng(seed)
+        self.total_faulty_production = np.zeros(NUM_WORKSTATIONS, dtype=int)
 
-            yield self.env.timeout(1)  # Time unit for checking failures
+    def start(self):
+        # Next-event scheme: every machine sleeps until its next failure instead of
+        # testing each time unit, with the same per-tick failure probability
+        for i in range(NUM_WORKSTATIONS):
+            self.env.process(self.failure_process(i))
 
-            # Stop simulation if it reaches the defined simulation time
-            if self.env.now >= SIMULATION_TIME:
-                break
+    def failure_process(self, i):
+        for tick in failure_ticks(self.rng, FAILURE_PROBABILITIES[i]):
+            yield self.env.timeout(tick - self.env.now)
+            self.total_faulty_production[i] += 1  # Increment faulty production count
 
-# Simulation function
-def simulate():
+def run(seed):
     env = simpy.Environment()
-    facility = ManufacturingFacility(env)
-    env.process(facility.production_process())
+    facility = ManufacturingFacility(env, seed=seed)
+    facility.start()
     env.run(until=SIMULATION_TIME)
+    return facility, {"faulty_production": facility.total_faulty_production.tolist()}
+
+# Simulation function
+def simulate(seed=None):
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    facility, result = run(seed)
+
+    import matplotlib.pyplot as plt  # Imported lazily, only needed for the charts
 
     # Plot bar chart for total faulty production per machine
     plt.figure(figsize=(10, 6))
@@ -40,11 +54,12 @@ def simulate():
     plt.xticks(range(NUM_WORKSTATIONS), [f'Machine {i+1}' for i in range(NUM_WORKSTATIONS)])
     plt.grid(axis='y')
     plt.show()
+    return seed, result
 
 # Main function
-def main():
+def main(seed=None):
     # Run simulation
-    simulate()
+    return simulate(seed=seed)
 
 if __name__ == "__main__":
     main()
@@ -1,6 +1,5 @@
 import simpy
 import numpy as np
-import matplotlib.pyplot as plt
 
 # Define constants
 NUM_WORKSTATIONS = 6
@@ -8,30 +7,45 @@ FAILURE_PROBABILITIES = [0.20, 0.10, 0.15, 0.05, 0.07, 0.10]
 FIXING_TIME_MEAN = 3
 SIMULATION_TIME = 5000
 
+def failure_ticks(rng, probability, horizon=SIMULATION_TIME):
+    # Ticks with a failure, drawn as geometric gaps instead of one draw per tick
+    tick = int(rng.geometric(probability)) - 1
+    while tick < horizon:
+        yield tick
+        tick += int(rng.geometric(probability))
+
 class ManufacturingFacility:
-    def __init__(self, env):
+    def __init__(self, env, seed=None):
         self.env = env
+        self.rng = np.random.default_rng(seed)
         self.fixing_times = [[] for _ in range(NUM_WORKSTATIONS)]
 
-    def production_process(self):
-        while True:
-            for i in range(NUM_WORKSTATIONS):
-                if np.random.random() < FAILURE_PROBABILITIES[i]:
-                    fixing_time = max(np.random.exponential(FIXING_TIME_MEAN), 0)  # Ensure non-negative fixing time
-                    self.fixing_times[i].append((self.env.now, fixing_time))  # Append (time, fixing_time) tuple
-
-            yield self.env.timeout(1)  # Time unit for checking failures
+    def start(self):
+        # Next-event scheme: every machine sleeps until its next failure instead of
+        # testing each time unit, with the same per-tick failure probability
+        for i in range(NUM_WORKSTATIONS):
+            self.env.process(self.failure_process(i))
 
-            # Stop simulation if it reaches the defined simulation time
-            if self.env.now >= SIMULATION_TIME:
-                break
+    def failure_process(self, i):
+        for tick in failure_ticks(self.rng, FAILURE_PROBABILITIES[i]):
+            yield self.env.timeout(tick - self.env.now)
+            fixing_time = max(self.rng.exponential(FIXING_TIME_MEAN), 0)  # Ensure non-negative fixing time
+            self.fixing_times[i].append((self.env.now, fixing_time))  # Append (time, fixing_time) tuple
 
-# Simulation function
-def simulate():
+def run(seed):
     env = simpy.Environment()
-    facility = ManufacturingFacility(env)
-    env.process(facility.production_process())
+    facility = ManufacturingFacility(env, seed=seed)
+    facility.start()
     env.run(until=SIMULATION_TIME)
+    return facility, {"fixing_times": [[list(pair) for pair in times] for times in facility.fixing_times]}
+
+# Simulation function
+def simulate(seed=None):
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    facility, result = run(seed)
+
+    import matplotlib.pyplot as plt  # Imported lazily, only needed for the charts
 
     # Plot connected scatter plot for fixing times per machine
     plt.figure(figsize=(10, 6))
@@ -46,11 +60,12 @@ def simulate():
     plt.legend()
     plt.grid(True)
     plt.show()
+    return seed, result
 
 # Main function
-def main():
+def main(seed=None):
     # Run simulation
-    simulate()
+    return simulate(seed=seed)
 
 if __name__ == "__main__":
     main()
@@ -1,42 +1,105 @@
 import simpy
 import numpy as np
-import matplotlib.pyplot as plt
+from tabulate import tabulate
 
 # Define constants
 NUM_WORKSTATIONS = 6
 ACCIDENT_PROBABILITY = 0.0001
 SIMULATION_TIME = 5000
+ACCIDENT_THRESHOLD = 3  # Accidents per workstation over the horizon, the rare event we estimate
+RARE_EVENT_REPLICATIONS = 20000
+
+def accident_ticks(rng, probability, horizon=SIMULATION_TIME):
+    # Ticks with an accident, drawn as geometric gaps instead of one draw per tick.
+    # A gap of k means the next accident is k ticks after the previous one, so the
+    # work is one draw per accident rather than one per tick
+    tick = int(rng.geometric(probability)) - 1
+    while tick < horizon:
+        yield tick
+        tick += int(rng.geometric(probability))
 
 class ManufacturingFacility:
-    def __init__(self, env):
+    def __init__(self, env, seed=None):
         self.env = env
-        self.workstations = [0] * NUM_WORKSTATIONS
+        self.rng = np.random.default_rng(seed)
+        self.workstations = np.zeros(NUM_WORKSTATIONS, dtype=int)
         self.accidents = []
 
-    def production_process(self):
-        while True:
-            # Check for accidents at each workstation
-            for i in range(NUM_WORKSTATIONS):
-                if np.random.random() < ACCIDENT_PROBABILITY:
-                    self.workstations[i] += 1
-                    self.accidents.append((self.env.now, i + 1))  # Append (time, workstation) tuple
+    def start(self):
+        # Next-event scheme: every workstation sleeps until its next accident instead of
+        # testing each time unit, with the same per-tick accident probability
+        for i in range(NUM_WORKSTATIONS):
+            self.env.process(self.accident_process(i))
 
-            yield self.env.timeout(1)  # Time unit for checking accidents
+    def accident_process(self, i):
+        for tick in accident_ticks(self.rng, ACCIDENT_PROBABILITY):
+            yield self.env.timeout(tick - self.env.now)
+            self.workstations[i] += 1
+            self.accidents.append((self.env.now, i + 1))  # Append (time, workstation) tuple
 
-            # Stop simulation if it reaches the defined simulation time
-            if self.env.now >= SIMULATION_TIME:
-                break
+def estimate_rare_events(replications=RARE_EVENT_REPLICATIONS, seed=None, proposal=None,
+                         threshold=ACCIDENT_THRESHOLD):
+    # Importance sampling: simulate every workstation with an inflated accident probability
+    # and weight each run by its likelihood ratio against ACCIDENT_PROBABILITY
+    if proposal is None:
+        proposal = max(ACCIDENT_PROBABILITY, threshold / SIMULATION_TIME)
+    rng = np.random.default_rng(seed)
+    counts = np.zeros((replications, NUM_WORKSTATIONS))
+    for r in range(replications):
+        for i in range(NUM_WORKSTATIONS):
+            counts[r, i] = sum(1 for _ in accident_ticks(rng, proposal))
+    weights = np.exp(counts * np.log(ACCIDENT_PROBABILITY / proposal)
+                     + (SIMULATION_TIME - counts) * np.log((1 - ACCIDENT_PROBABILITY) / (1 - proposal)))
 
-# Simulation function
-def simulate():
+    estimates = {}
+    for name, values in [("Mean Accidents", counts), ("P(Any Accident)", counts > 0),
+                         (f"P(>= {threshold} Accidents)", counts >= threshold)]:
+        weighted = weights * values
+        estimates[name] = (weighted.mean(axis=0), weighted.std(axis=0, ddof=1) / np.sqrt(replications))
+    return {
+        "proposal": proposal,
+        "estimates": estimates,
+        "effective_sample_size": weights.sum(axis=0) ** 2 / (weights ** 2).sum(axis=0),
+        # Random draws per replication: one per accident plus the one past the horizon,
+        # against one per tick and workstation when every tick is tested
+        "draws": (counts + 1).sum() / replications,
+        "tick_draws": SIMULATION_TIME * NUM_WORKSTATIONS,
+    }
+
+def print_rare_event_report(result):
+    rows = []
+    for i in range(NUM_WORKSTATIONS):
+        row = [f"Workstation {i + 1}"]
+        for mean, error in result["estimates"].values():
+            row.append(f"{mean[i]:.3g} ± {1.96 * error[i]:.2g}")
+        rows.append(row + [round(result["effective_sample_size"][i])])
+    print(f"\nImportance sampling with accident probability {result['proposal']:g} "
+          f"instead of {ACCIDENT_PROBABILITY:g}:")
+    print(tabulate(rows, headers=["Workstation"] + list(result["estimates"]) + ["Effective Samples"]))
+    print(f"Random draws per replication: {result['draws']:.1f} (every tick: {result['tick_draws']})")
+
+def run(seed):
     env = simpy.Environment()
-    facility = ManufacturingFacility(env)
-    env.process(facility.production_process())
+    facility = ManufacturingFacility(env, seed=seed)
+    facility.start()
     env.run(until=SIMULATION_TIME)
+    return facility, {"accidents": facility.workstations.tolist(),
+                      "accident_times": [list(pair) for pair in sorted(facility.accidents)]}
+
+# Simulation function
+def simulate(seed=None):
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    facility, result = run(seed)
 
     # Plot connected scatter plot for daily accidents per workstation
-    accidents = facility.accidents
+    accidents = sorted(facility.accidents)  # Workstation processes may record out of order
+    if not accidents:
+        print("No accidents in this run")
+        return seed, result
     times, workstations = zip(*accidents)  # Unzip the list of (time, workstation) tuples
+    import matplotlib.pyplot as plt  # Imported lazily, only needed for the charts
+
     plt.figure(figsize=(10, 6))
     plt.plot(times, workstations, '-o', markersize=5)
     plt.xlabel('Time')
@@ -45,11 +108,14 @@ def simulate():
     plt.yticks(range(1, NUM_WORKSTATIONS + 1))
     plt.grid(True)
     plt.show()
+    return seed, result
 
 # Main function
-def main():
+def main(seed=None):
     # Run simulation
-    simulate()
+    run = simulate(seed=seed)
+    print_rare_event_report(estimate_rare_events())
+    return run
 
 if __name__ == "__main__":
     main()
@@ -1,6 +1,5 @@
 import simpy
 import numpy as np
-import matplotlib.pyplot as plt
 
 # Define constants
 NUM_WORKSTATIONS = 6
@@ -14,8 +13,9 @@ FIXING_TIME_MEAN = 3
 WORK_TIME_MEAN = 4
 
 class ManufacturingFacility:
-    def __init__(self, env):
+    def __init__(self, env, seed=None):
         self.env = env
+        self.rng = np.random.default_rng(seed)
         self.workstations = [simpy.Resource(env) for _ in range(NUM_WORKSTATIONS)]
         self.bins = [BIN_CAPACITY for _ in range(NUM_BINS)]
         self.supplier_device = simpy.Resource(env)
@@ -23,19 +23,19 @@ class ManufacturingFacility:
         self.total_fixing_time = 0
         self.total_production_delay = 0
         self.total_quality_failures = 0
-        self.downtime = [0] * NUM_WORKSTATIONS
+        self.downtime = np.zeros(NUM_WORKSTATIONS, dtype=int)
 
     def production_process(self):
         while True:
             # Check for accidents
-            if np.random.random() < ACCIDENT_PROBABILITY:
+            if self.rng.random() < ACCIDENT_PROBABILITY:
                 yield self.env.timeout(1)  # Stop production for 1 time unit
                 continue
             
             # Get a bin of raw material
             with self.supplier_device.request() as req:
                 yield req
-                bin_index = np.random.randint(NUM_BINS)
+                bin_index = self.rng.integers(NUM_BINS)
                 yield self.env.timeout(1)  # Resupply time
                 self.bins[bin_index] = BIN_CAPACITY
             
@@ -43,18 +43,18 @@ class ManufacturingFacility:
             start_time = self.env.now
             for i in range(NUM_WORKSTATIONS):
                 # Check if the workstation fails
-                if np.random.random() < FAILURE_PROBABILITIES[i]:
+                if self.rng.random() < FAILURE_PROBABILITIES[i]:
                     self.downtime[i] += 1
-                    yield self.env.timeout(np.random.exponential(FIXING_TIME_MEAN))
+                    yield self.env.timeout(self.rng.exponential(FIXING_TIME_MEAN))
                 
                 # Use a bin of raw material
                 self.bins[bin_index] -= 1
                 
                 # Process time at the workstation
-                yield self.env.timeout(np.random.normal(WORK_TIME_MEAN))
+                yield self.env.timeout(max(self.rng.normal(WORK_TIME_MEAN), 0))  # Ensure non-negative work time
                 
                 # Check for quality issues
-                if i == NUM_WORKSTATIONS - 1 and np.random.random() < REJECTION_PROBABILITY:
+                if i == NUM_WORKSTATIONS - 1 and self.rng.random() < REJECTION_PROBABILITY:
                     self.total_quality_failures += 1
                     break
                 
@@ -72,12 +72,23 @@ class ManufacturingFacility:
             if self.production_count >= PRODUCTION_TIME:
                 break
 
-# Simulation function
-def simulate():
+def run(seed):
     env = simpy.Environment()
-    facility = ManufacturingFacility(env)
+    facility = ManufacturingFacility(env, seed=seed)
     env.process(facility.production_process())
     env.run()
+    return facility, {
+        "production": facility.production_count,
+        "quality_failures": facility.total_quality_failures,
+        "production_delay": facility.total_production_delay,
+        "downtime": facility.downtime.tolist(),
+    }
+
+# Simulation function
+def simulate(seed=None):
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    facility, result = run(seed)
 
     # Calculate and return all metrics
     final_production = facility.production_count
@@ -89,6 +100,8 @@ def simulate():
     print("Total faulty products:", total_faulty_products)
     print("Total successful products:", total_successful_products)
 
+    import matplotlib.pyplot as plt  # Imported lazily, only needed for the charts
+
     # Create a pie chart
     labels = ['Faulty Products', 'Successful Products']
     sizes = [total_faulty_products, total_successful_products]
@@ -97,11 +110,12 @@ def simulate():
     plt.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
     plt.title('Production Results')
     plt.show()
+    return seed, result
 
 # Main function
-def main():
+def main(seed=None):
     # Run simulation
-    simulate()
+    return simulate(seed=seed)
 
 if __name__ == "__main__":
     main()
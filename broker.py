@@ -0,0 +1,172 @@
+import argparse
+import json
+import multiprocessing
+import socket
+import statistics
+import sys
+import time
+import traceback
+
+from tabulate import tabulate
+
+from replication import MODELS, ResultStore, check_params, job_id, run_job
+
+# A SQLite file stands in for the work-queue broker; on a shared filesystem
+# every node runs workers against the same file
+LEASE_TIME = 600
+MAX_ATTEMPTS = 3
+
+class Broker(object):
+    def __init__(self, path, lease_time=LEASE_TIME, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        self.results = ResultStore(path)
+        self.db = self.results.db
+        self.db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY, model TEXT, params TEXT, seed INTEGER,
+            status TEXT, attempts INTEGER, worker TEXT, lease_until REAL,
+            started_at REAL, error TEXT)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+        self.db.commit()
+
+    def submit(self, model, params, seeds):
+        check_params(model, params)
+        rows = [(job_id(model, params, seed), model, json.dumps(params, sort_keys=True), seed)
+                for seed in seeds]
+        # Jobs are keyed by scenario and seed, submitting the same sweep twice adds nothing
+        before = self.db.total_changes
+        self.db.executemany("INSERT OR IGNORE INTO jobs VALUES (?, ?, ?, ?, 'pending', 0, NULL, NULL, NULL, NULL)",
+                            rows)
+        self.db.commit()
+        return self.db.total_changes - before
+
+    def claim(self, worker):
+        now = time.time()
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            # Running jobs whose lease ran out belong to a dead worker and are handed out again
+            row = self.db.execute("""SELECT job_id, model, params, seed FROM jobs
+                WHERE status = 'pending' OR (status = 'running' AND lease_until < ?)
+                LIMIT 1""", (now,)).fetchone()
+            if row is not None:
+                self.db.execute("""UPDATE jobs SET status = 'running', attempts = attempts + 1,
+                    worker = ?, lease_until = ?, started_at = ? WHERE job_id = ?""",
+                                (worker, now + self.lease_time, now, row[0]))
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2]), row[3]
+
+    def complete(self, job, worker, result, elapsed):
+        key, model, params, seed = job
+        self.results.put(model, params, seed, result, worker, elapsed)
+        self.db.execute("UPDATE jobs SET status = 'done', error = NULL WHERE job_id = ?", (key,))
+        self.db.commit()
+
+    def fail(self, job, error):
+        self.db.execute("""UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+            error = ? WHERE job_id = ?""", (self.max_attempts, error, job[0]))
+        self.db.commit()
+
+    def counts(self):
+        return dict(self.db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def worker_report(self):
+        # Throughput per worker: jobs finished over the wall time between its first and last job
+        rows = self.db.execute("""SELECT worker, COUNT(*), SUM(elapsed), MIN(finished_at - elapsed), MAX(finished_at)
+            FROM results GROUP BY worker ORDER BY worker""").fetchall()
+        report = []
+        for worker, jobs, busy, first, last in rows:
+            span = max(last - first, 1e-9)
+            report.append([worker, jobs, busy, jobs / span, busy / span])
+        return report
+
+    def scenario_report(self):
+        scenarios = {}
+        for model, params, seed, result in self.results.load():
+            production = result["production"]
+            total = sum(production) if isinstance(production, list) else production
+            scenarios.setdefault((model, json.dumps(params, sort_keys=True)), []).append(total)
+        report = []
+        for (model, params), totals in sorted(scenarios.items()):
+            report.append([model, params, len(totals), statistics.mean(totals),
+                           statistics.stdev(totals) if len(totals) > 1 else 0])
+        return report
+
+    def close(self):
+        self.db.close()
+
+def work(path, worker=None, poll_interval=1.0, exit_when_idle=True):
+    worker = worker or f"{socket.gethostname()}-{multiprocessing.current_process().pid}"
+    broker = Broker(path)
+    done = 0
+    try:
+        while True:
+            job = broker.claim(worker)
+            if job is None:
+                if exit_when_idle:
+                    return done
+                time.sleep(poll_interval)
+                continue
+            try:
+                _, result, elapsed = run_job(job[1:])
+            except Exception:
+                broker.fail(job, traceback.format_exc())
+                continue
+            broker.complete(job, worker, result, elapsed)
+            done += 1
+    finally:
+        broker.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite work-queue broker for simulation replications")
+    parser.add_argument("database")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit = commands.add_parser("submit", help="queue scenario x seed jobs")
+    submit.add_argument("--model", default="line", choices=sorted(MODELS))
+    submit.add_argument("--scenario", action="append", default=[],
+                        help="JSON object of scenario parameters, may be repeated")
+    submit.add_argument("--seeds", type=int, default=10)
+    submit.add_argument("--first-seed", type=int, default=0)
+
+    worker = commands.add_parser("work", help="run jobs until the queue is empty")
+    worker.add_argument("--processes", type=int, default=1)
+    worker.add_argument("--name", default=None)
+    worker.add_argument("--wait", action="store_true", help="keep polling for new jobs instead of exiting")
+
+    commands.add_parser("report", help="show queue status and per-worker throughput")
+
+    args = parser.parse_args()
+    if args.command == "submit":
+        broker = Broker(args.database)
+        seeds = range(args.first_seed, args.first_seed + args.seeds)
+        scenarios = [json.loads(scenario) for scenario in args.scenario or ["{}"]]
+        try:
+            for params in scenarios:
+                check_params(args.model, params)
+        except ValueError as error:
+            sys.exit(str(error))
+        added = sum(broker.submit(args.model, params, seeds) for params in scenarios)
+        print(f"Queued {added} new jobs")
+    elif args.command == "work":
+        names = [f"{args.name or socket.gethostname()}-{i}" for i in range(args.processes)]
+        with multiprocessing.Pool(args.processes) as pool:
+            done = pool.starmap(work, [(args.database, name, 1.0, not args.wait) for name in names])
+        print(f"Completed {sum(done)} jobs")
+    else:
+        broker = Broker(args.database)
+        print(tabulate(sorted(broker.counts().items()), headers=["Status", "Jobs"]))
+        print()
+        print(tabulate(broker.worker_report(),
+                       headers=["Worker", "Jobs", "Busy Time (s)", "Jobs / s", "Utilization"]))
+        print()
+        print(tabulate(broker.scenario_report(),
+                       headers=["Model", "Scenario", "Replications", "Mean Production", "Std Dev"]))
+
+if __name__ == "__main__":
+    main()
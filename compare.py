@@ -0,0 +1,135 @@
+import json
+import math
+
+import numpy as np
+from tabulate import tabulate
+
+from replication import resolve_params
+
+Z_95 = 1.96
+
+def scenario_key(model, params):
+    # Scenarios that only differ in spelled out defaults are the same scenario
+    return json.dumps(resolve_params(model, params), sort_keys=True)
+
+def load_scenarios(store, model="line", metric="production"):
+    # One pass over the store: {scenario key: {seed: per-station values}}. Results without a
+    # per-station list for the metric (older facility runs, scalar counters) are left out
+    scenarios = {}
+    for _, params, seed, result in store.load(model):
+        values = result.get(metric)
+        if isinstance(values, list):
+            scenarios.setdefault(scenario_key(model, params), {})[seed] = values
+    return scenarios
+
+def describe(params, baseline):
+    parts = []
+    for name in sorted(set(params) | set(baseline)):
+        value, base = params.get(name), baseline.get(name)
+        if value == base:
+            continue
+        if isinstance(value, list) and isinstance(base, list) and len(value) == len(base):
+            parts += [f"{name}[{i + 1}]={v}" for i, (v, b) in enumerate(zip(value, base)) if v != b]
+        else:
+            parts.append(f"{name}={value}")
+    return ", ".join(parts)
+
+def paired_differences(scenarios, baseline, metric="production"):
+    # Every variant against the baseline over their common seeds, all variants in one
+    # (variants x seeds x stations) array. Seeds a variant did not run are NaN and drop out
+    base = scenarios[baseline]
+    seeds = sorted(base)
+    width = len(base[seeds[0]])
+    keys = [key for key, runs in scenarios.items()
+            if key != baseline and len(next(iter(runs.values()))) == width and len(base.keys() & runs.keys()) > 1]
+    column = {seed: j for j, seed in enumerate(seeds)}
+    values = np.full((len(keys), len(seeds), width), np.nan)
+    for k, key in enumerate(keys):
+        for seed, row in scenarios[key].items():
+            if seed in column:
+                values[k, column[seed]] = row
+    baseline_values = np.array([base[seed] for seed in seeds], dtype=float)
+
+    differences = values - baseline_values
+    paired = ~np.isnan(differences[:, :, 0])
+    pairs = paired.sum(axis=1)
+
+    def mean_and_ci(samples):
+        # samples is (variants x seeds x ...), NaN where unpaired
+        n = pairs.reshape((-1,) + (1,) * (samples.ndim - 2))
+        mask = paired.reshape(paired.shape + (1,) * (samples.ndim - 2))
+        mean = np.where(mask, samples, 0).sum(axis=1) / n
+        variance = (np.where(mask, samples - mean[:, None], 0) ** 2).sum(axis=1) / (n - 1)
+        return mean, Z_95 * np.sqrt(variance / n)
+
+    station_mean, station_ci = mean_and_ci(differences)
+    total_mean, total_ci = mean_and_ci(differences.sum(axis=2))
+    baseline_params = json.loads(baseline)
+    return {
+        "metric": metric,
+        "baseline": baseline_params,
+        "baseline_mean": baseline_values.mean(axis=0),
+        "baseline_runs": len(seeds),
+        "changes": [describe(json.loads(key), baseline_params) for key in keys],
+        "labels": [f"S{k + 1}" for k in range(len(keys))],
+        "pairs": pairs,
+        "station_mean": station_mean,
+        "station_ci": station_ci,
+        "total_mean": total_mean,
+        "total_ci": total_ci,
+        "skipped": len(scenarios) - len(keys) - 1,
+    }
+
+def compare(store, baseline_params=None, model="line", metric="production"):
+    scenarios = load_scenarios(store, model, metric)
+    baseline = scenario_key(model, baseline_params or {})
+    if baseline not in scenarios:
+        raise KeyError("the baseline scenario has no stored results")
+    return paired_differences(scenarios, baseline, metric)
+
+def print_comparison_report(result):
+    rows = []
+    for k in np.argsort(-result["total_mean"]):
+        significant = np.abs(result["station_mean"][k]) > result["station_ci"][k]
+        up = [str(i + 1) for i in np.flatnonzero(significant & (result["station_mean"][k] > 0))]
+        down = [str(i + 1) for i in np.flatnonzero(significant & (result["station_mean"][k] < 0))]
+        rows.append([result["labels"][k], result["changes"][k], result["pairs"][k],
+                     f"{result['total_mean'][k]:+.1f} ± {result['total_ci'][k]:.1f}",
+                     ",".join(up) or "-", ",".join(down) or "-"])
+    print(f"Total {result['metric']} against the baseline ({sum(result['baseline_mean']):.1f} over "
+          f"{result['baseline_runs']} runs), paired by seed with 95% intervals:")
+    print(tabulate(rows, headers=["Scenario", "Changes", "Pairs", "Difference", "Stations Up", "Stations Down"]))
+    if result["skipped"]:
+        print(f"\n{result['skipped']} scenarios skipped: a different number of stations or fewer than 2 common seeds")
+
+def plot_comparison(result, top=None):
+    import matplotlib.pyplot as plt
+
+    order = np.argsort(-result["total_mean"])[:top]
+    stations = np.arange(result["station_mean"].shape[1])
+    bar_width = 0.8 / max(len(order), 1)
+    colors = plt.cm.viridis(np.linspace(0, 1, max(len(order), 1)))
+    figure, (per_station, totals) = plt.subplots(2, 1, figsize=(12, 9),
+                                                 gridspec_kw={"height_ratios": [3, 2]})
+    # Grouped bars, one group per station and one bar per scenario
+    for position, k in enumerate(order):
+        per_station.bar(stations + position * bar_width, result["station_mean"][k], width=bar_width,
+                        yerr=result["station_ci"][k], color=colors[position], edgecolor='grey',
+                        label=result["labels"][k])
+    per_station.axhline(0, color='black', linewidth=1)
+    per_station.set_xticks(stations + bar_width * (len(order) - 1) / 2)
+    per_station.set_xticklabels([f"Station {i + 1}" for i in stations])
+    per_station.set_ylabel(f"{result['metric'].replace('_', ' ').title()} difference", fontweight='bold')
+    per_station.set_title('Per-Station Difference Against the Baseline')
+    per_station.legend(ncol=math.ceil(len(order) / 10), fontsize='small')
+
+    positions = np.arange(len(order))
+    totals.barh(positions, result["total_mean"][order], xerr=result["total_ci"][order], color=colors[:len(order)],
+                edgecolor='grey')
+    totals.axvline(0, color='black', linewidth=1)
+    totals.set_yticks(positions)
+    totals.set_yticklabels([result["labels"][k] for k in order])
+    totals.invert_yaxis()
+    totals.set_xlabel(f"Total {result['metric'].replace('_', ' ')} difference", fontweight='bold')
+    figure.tight_layout()
+    plt.show()
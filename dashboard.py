@@ -0,0 +1,486 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from refillsystem import REFILL_POLICIES
+
+# Only argparse, the standard library and refillsystem's constants are imported up front, every
+# subcommand imports what it needs so numbers-only runs never load matplotlib
+DEFAULT_ERROR_RATES = [0.20, 0.10, 0.15, 0.05, 0.07, 0.10]
+COLD_START_BUDGET = 0.5  # seconds for a numbers-only "simulate" run, interpreter start included
+DATA_VISUALIZATION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "DataVisualization")
+CHARTS = [
+    "GcolumnChart", "columnChart", "columnChartDelay", "columnChartFaulty", "columnpermachinefaulty",
+    "connectedScatter", "paretoChart", "pieChart", "totalpropdmachine",
+]
+
+def error_rates_arg(value):
+    return [float(rate) for rate in value.split(",")]
+
+def add_line_arguments(parser):
+    parser.add_argument("--stations", type=int, default=None, help="defaults to the number of error rates")
+    parser.add_argument("--error-rates", type=error_rates_arg, default=DEFAULT_ERROR_RATES,
+                        help="comma separated, repeated to fill --stations")
+    parser.add_argument("--runs", type=int, default=500, help="simulation horizon")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--refill-policy", default="fifo", choices=REFILL_POLICIES)
+    parser.add_argument("--crew-size", type=int, default=None)
+
+def line_arguments(args):
+    num_stations = args.stations or len(args.error_rates)
+    error_rates = (args.error_rates * num_stations)[:num_stations]
+    return num_stations, error_rates
+
+def simulate(args):
+    import simpy
+
+    import manufactoringsim
+
+    manufactoringsim.VERBOSE = args.verbose
+    num_stations, error_rates = line_arguments(args)
+    if args.manifest and (args.calendar or args.mix or args.random_mix):
+        sys.exit("--manifest only covers plain line runs, without --calendar or a product mix")
+    if args.metrics_port is not None and (args.profile or args.mix or args.random_mix):
+        sys.exit("--metrics-port only covers plain line runs, without --profile or a product mix")
+
+    exporter = None
+    if args.export:
+        from eventexport import EventExporter
+        exporter = EventExporter(args.export)
+
+    calendar = None
+    if args.calendar:
+        from shiftcalendar import ShiftCalendar
+        with open(args.calendar) as f:
+            try:
+                calendar = ShiftCalendar.from_dict(json.load(f))
+            except ValueError as error:
+                sys.exit(f"Invalid calendar {args.calendar}: {error}")
+
+    tracker = None
+    if args.flow:
+        from productflow import FlowTracker
+        if args.mix or args.random_mix:
+            tracker = FlowTracker()
+        else:
+            # Line stations do not hand items on, the downstream stores are sinks
+            tracker = FlowTracker(note="Stations do not pass products on: every product is one item at one "
+                                       "station, so cycle times and WIP are per station visit")
+
+    if args.mix or args.random_mix:
+        simulate_mix(args, num_stations, error_rates, exporter, tracker, calendar)
+        return
+
+    metrics = None
+    env = simpy.Environment()
+    if args.metrics_port is not None:
+        from metrics import CountingEnvironment, CountingRealtimeEnvironment, MetricsServer
+        if args.realtime:
+            env = CountingRealtimeEnvironment(factor=args.realtime, strict=False)
+        else:
+            env = CountingEnvironment()
+        metrics = MetricsServer(env, args.metrics_port, interval=args.metrics_interval)
+        print(f"Serving metrics on http://127.0.0.1:{metrics.port}/metrics")
+
+    if args.profile:
+        from instrumentation import Instrumentation, InstrumentedEnvironment
+        env = InstrumentedEnvironment()
+        with Instrumentation(env) as instrumentation:
+            stations = manufactoringsim.run_simulation(env, num_stations, error_rates, args.runs, exporter,
+                                                       args.refill_policy, args.crew_size, tracker=tracker,
+                                                       calendar=calendar, seed=args.seed)
+        instrumentation.report()
+        instrumentation.write_folded(args.profile)
+    else:
+        stations = manufactoringsim.run_simulation(env, num_stations, error_rates, args.runs, exporter,
+                                                   args.refill_policy, args.crew_size, tracker=tracker,
+                                                   calendar=calendar, seed=args.seed, metrics=metrics)
+    if exporter is not None:
+        exporter.close()
+    if metrics is not None:
+        metrics.close()
+
+    manufactoringsim.print_report(stations, num_stations)
+    if tracker is not None:
+        print_flow_report(tracker, args.runs)
+    if args.manifest:
+        write_line_manifest(args, num_stations, error_rates, stations)
+    if args.plot:
+        manufactoringsim.plot_results(stations, num_stations)
+
+def write_manifest(path, model, params, seed, result):
+    from manifest import build_manifest
+
+    manifest = build_manifest(model, params, seed, result)
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"\nManifest written to {path}, result hash {manifest['result_hash']}")
+
+def write_line_manifest(args, num_stations, error_rates, stations):
+    from replication import line_result
+
+    params = {"num_stations": num_stations, "error_rates": error_rates, "num_runs": args.runs,
+              "refill_policy": args.refill_policy, "crew_size": args.crew_size}
+    write_manifest(args.manifest, "line", params, args.seed, line_result(stations))
+
+def print_flow_report(tracker, horizon):
+    from tabulate import tabulate
+
+    print("\nProduct Flow:")
+    if tracker.note:
+        print(tracker.note)
+    print(tabulate([[name.replace("_", " ").title(), value] for name, value in tracker.report(horizon).items()]))
+
+def simulate_mix(args, num_stations, error_rates, exporter, tracker, calendar):
+    import simpy
+
+    import manufactoringsim
+    import productmix
+
+    if args.mix:
+        with open(args.mix) as f:
+            product_types = [productmix.ProductType.from_dict(data) for data in json.load(f)]
+    else:
+        product_types = productmix.random_mix(args.random_mix, num_stations, args.seed)
+    line = productmix.run_mixed_simulation(simpy.Environment(), num_stations, error_rates, product_types, args.runs,
+                                           refill_policy=args.refill_policy, crew_size=args.crew_size,
+                                           tracker=tracker, exporter=exporter, calendar=calendar, seed=args.seed)
+    if exporter is not None:
+        exporter.close()
+    manufactoringsim.print_report(line.stations, num_stations, line.ideal_cycle_times())
+    productmix.print_product_report(line)
+    if tracker is not None:
+        print_flow_report(tracker, args.runs)
+    if args.plot:
+        manufactoringsim.plot_results(line.stations, num_stations)
+        productmix.plot_product_results(line)
+
+def sweep(args):
+    from tabulate import tabulate
+
+    from replication import ResultStore, check_params, run_replications
+
+    scenarios = [json.loads(scenario) for scenario in args.scenario or ["{}"]]
+    try:
+        for params in scenarios:
+            check_params(args.model, params)
+    except ValueError as error:
+        sys.exit(str(error))
+    store = ResultStore(args.store) if args.store else None
+    seeds = list(range(args.first_seed, args.first_seed + args.seeds))
+    rows = []
+    for scenario, params in zip(args.scenario or ["{}"], scenarios):
+        results = run_replications(args.model, params, seeds, store, args.processes)
+        totals = [sum(r["production"]) if isinstance(r["production"], list) else r["production"] for r in results]
+        rows.append([scenario, len(totals), statistics.mean(totals),
+                     statistics.stdev(totals) if len(totals) > 1 else 0])
+    print(tabulate(rows, headers=["Scenario", "Replications", "Mean Production", "Std Dev"]))
+
+def optimize(args):
+    from optimizer import optimize, print_optimization_report
+    from replication import ResultStore
+
+    num_stations, error_rates = line_arguments(args)
+    store = ResultStore(args.store) if args.store else None
+    base_params = {"num_runs": args.runs, "refill_policy": args.refill_policy, "crew_size": args.crew_size}
+    result = optimize(error_rates, args.budget, base_params, args.cpu_budget, store, args.processes,
+                      args.target, args.indifference)
+    print_optimization_report(result, args.top)
+
+def sensitivity(args):
+    from replication import ResultStore
+    from sensitivity import analyze, plot_tornado, print_sensitivity_report
+
+    num_stations, error_rates = line_arguments(args)
+    store = ResultStore(args.store) if args.store else None
+    base_params = {"num_runs": args.runs, "refill_policy": args.refill_policy, "crew_size": args.crew_size}
+    try:
+        result = analyze(error_rates, args.method, base_params, args.core_hours, args.samples, store, args.processes,
+                         args.output, args.seed)
+    except ValueError as error:
+        sys.exit(f"Sensitivity budget too small: {error}")
+    print_sensitivity_report(result)
+    if args.plot:
+        plot_tornado(result)
+
+def compare(args):
+    from compare import compare, plot_comparison, print_comparison_report
+    from replication import ResultStore
+
+    store = ResultStore(args.store)
+    start = time.perf_counter()
+    try:
+        result = compare(store, json.loads(args.baseline), args.model, args.metric)
+    except KeyError:
+        sys.exit(f"No stored results for the baseline {args.baseline}, run it with sweep first")
+    finally:
+        store.close()
+    elapsed = time.perf_counter() - start
+    print_comparison_report(result)
+    print(f"\n{len(result['labels'])} scenarios compared in {elapsed:.3f} seconds")
+    if args.plot:
+        plot_comparison(result, args.top)
+
+def what_if(args):
+    from manufactoringsim import DEFAULT_PARAMS
+    from surrogate import print_what_if_report, what_if
+
+    num_stations, error_rates = line_arguments(args)
+    params = json.loads(args.params)
+    unknown = sorted(set(params) - set(DEFAULT_PARAMS))
+    if unknown:
+        sys.exit(f"Unknown model parameters {', '.join(unknown)}, expected some of {', '.join(sorted(DEFAULT_PARAMS))}")
+    start = time.perf_counter()
+    result = what_if(error_rates, args.runs, params, args.tolerance, args.refill_policy, args.crew_size, args.seed)
+    elapsed = time.perf_counter() - start
+    print_what_if_report(result)
+    print(f"Answered in {elapsed:.3f} seconds ({result['source']})")
+
+def edit_arg(value):
+    station, rate = value.split("=")
+    return int(station), float(rate)
+
+def edit(args):
+    from tabulate import tabulate
+
+    from incremental import IncrementalLine
+    from replication import run_line
+
+    if args.crew_size:
+        sys.exit("Incremental re-simulation does not support a maintenance crew")
+    num_stations, error_rates = line_arguments(args)
+    start = time.perf_counter()
+    line = IncrementalLine(num_stations, error_rates, args.runs, args.refill_policy, seed=args.seed)
+    print(f"Initial run of {num_stations} stations: {time.perf_counter() - start:.3f} s")
+    rows = []
+    for station, rate in args.set:
+        start = time.perf_counter()
+        simulated = line.set_error_rate(station, rate)
+        elapsed = time.perf_counter() - start
+        row = [f"Work Station {station} -> {rate:g}", len(simulated), line.rounds, f"{elapsed:.3f}"]
+        if args.verify:
+            start = time.perf_counter()
+            full = run_line({"num_stations": num_stations, "error_rates": line.error_rates, "num_runs": args.runs,
+                             "refill_policy": args.refill_policy}, args.seed)
+            row += [f"{time.perf_counter() - start:.3f}", full == line.result()]
+        rows.append(row)
+    headers = ["Edit", "Stations Simulated", "Rounds", "Seconds"]
+    if args.verify:
+        headers += ["Full Run Seconds", "Identical"]
+    print(tabulate(rows, headers=headers))
+    if any(row[1] == num_stations for row in rows):
+        print("\nEdits that simulated every station reused nothing: the refill queue links all stations, "
+              "those runs are full runs of the faster station loop")
+    print()
+    print(tabulate([[name.replace("_", " ").title(), value] for name, value in line.registry.totals().items()],
+                   headers=["Total", "Value"]))
+
+def render(args):
+    if args.chart == "line":
+        import simpy
+
+        import manufactoringsim
+
+        manufactoringsim.VERBOSE = False
+        num_stations, error_rates = line_arguments(args)
+        stations = manufactoringsim.run_simulation(simpy.Environment(), num_stations, error_rates, args.runs,
+                                                   refill_policy=args.refill_policy, crew_size=args.crew_size,
+                                                   seed=args.seed)
+        manufactoringsim.print_report(stations, num_stations)
+        if args.manifest:
+            write_line_manifest(args, num_stations, error_rates, stations)
+        manufactoringsim.plot_results(stations, num_stations)
+        return
+    import importlib
+
+    sys.path.insert(0, DATA_VISUALIZATION_DIR)
+    seed, result = importlib.import_module(args.chart).main(args.seed)
+    if args.manifest:
+        # Replays through the facility model of replication.py, which runs the same chart
+        write_manifest(args.manifest, "facility", {"chart": args.chart}, seed, result)
+
+def replay(args):
+    import simpy
+
+    import manufactoringsim
+    from tracereplay import import_log, run_replay
+
+    if args.import_log:
+        stations = import_log(args.import_log, args.traces)
+        print(f"Imported traces for {len(stations)} stations into {args.traces}")
+    manufactoringsim.VERBOSE = args.verbose
+    start = time.perf_counter()
+    try:
+        stations, unused = run_replay(simpy.Environment(), args.traces, args.runs, args.mode, args.refill_policy,
+                                      args.crew_size, seed=args.seed)
+    except (OSError, ValueError) as error:
+        sys.exit(f"Cannot replay {args.traces}: {error}")
+    elapsed = time.perf_counter() - start
+    manufactoringsim.print_report(stations, len(stations))
+    print(f"\nReplayed {args.runs} time units in {elapsed:.2f} seconds ({args.mode})")
+    if unused:
+        print("Traces never drawn from: " + ", ".join(f"{kind} of station {station}" for station, kind in unused))
+    if args.plot:
+        manufactoringsim.plot_results(stations, len(stations))
+
+def bench(args):
+    if args.repairs:
+        # Regression check: one repair per breakdown, on the first station's two loops too
+        import simpy
+
+        import manufactoringsim
+        from maintenance import unmatched_repairs
+
+        manufactoringsim.VERBOSE = False
+        failed = False
+        for crew_size in (None, len(DEFAULT_ERROR_RATES)):
+            stations = manufactoringsim.run_simulation(simpy.Environment(), len(DEFAULT_ERROR_RATES),
+                                                       DEFAULT_ERROR_RATES, 20000, crew_size=crew_size, seed=3)
+            unmatched = unmatched_repairs(stations)
+            print(f"Crew size {crew_size}: {sum(station.breakdowns for station in stations)} breakdowns, "
+                  f"{sum(station.repairs for station in stations)} repairs, "
+                  f"unmatched stations {unmatched or 'none'}")
+            failed = failed or bool(unmatched)
+        return 1 if failed else 0
+
+    if args.mix:
+        from tabulate import tabulate
+
+        from productmix import bench_mix
+        result = bench_mix(args.mix_types, args.mix_stations, args.mix_runs)
+        print(tabulate([[name.replace("_", " ").title(), value] for name, value in result.items()]))
+        return 0
+
+    # Cold start of a fresh interpreter running a short numbers-only simulation
+    command = [sys.executable, os.path.abspath(__file__), "simulate", "--runs", str(args.runs)]
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    print(f"Cold start over {args.repeat} runs: best {best:.3f} s, "
+          f"median {statistics.median(timings):.3f} s, budget {args.budget:.3f} s")
+    if best > args.budget:
+        print("Cold start is over budget")
+        return 1
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manufacturing line simulation dashboard")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    simulate_parser = commands.add_parser("simulate", help="run the line and print the tables")
+    add_line_arguments(simulate_parser)
+    simulate_parser.add_argument("--verbose", action="store_true", help="print every station event")
+    simulate_parser.add_argument("--plot", action="store_true", help="draw the charts afterwards")
+    simulate_parser.add_argument("--export", help="write the event stream to this Parquet/Arrow/CSV path")
+    simulate_parser.add_argument("--flow", action="store_true", help="track products, cycle times and WIP")
+    simulate_parser.add_argument("--profile", help="instrument the run and write a folded flamegraph here")
+    simulate_parser.add_argument("--calendar", help="JSON shift calendar with planned downtime windows")
+    simulate_parser.add_argument("--mix", help="JSON list of product types with their routings")
+    simulate_parser.add_argument("--random-mix", type=int, default=0, help="simulate this many random product types")
+    simulate_parser.add_argument("--manifest", help="write a replayable run manifest to this JSON path")
+    simulate_parser.add_argument("--metrics-port", type=int, default=None,
+                                 help="serve Prometheus metrics on this local port while the run lasts")
+    simulate_parser.add_argument("--metrics-interval", type=float, default=1.0,
+                                 help="simulation time between metric snapshots")
+    simulate_parser.add_argument("--realtime", type=float, default=None,
+                                 help="pace the run at this many wall seconds per time unit")
+    simulate_parser.set_defaults(handler=simulate)
+
+    sweep_parser = commands.add_parser("sweep", help="run replications of one or more scenarios")
+    sweep_parser.add_argument("--model", default="line", choices=["line", "facility"])
+    sweep_parser.add_argument("--scenario", action="append", default=[],
+                              help="JSON object of scenario parameters, may be repeated")
+    sweep_parser.add_argument("--seeds", type=int, default=10)
+    sweep_parser.add_argument("--first-seed", type=int, default=0)
+    sweep_parser.add_argument("--processes", type=int, default=None)
+    sweep_parser.add_argument("--store", help="SQLite result store reused across sweeps")
+    sweep_parser.set_defaults(handler=sweep)
+
+    optimize_parser = commands.add_parser("optimize", help="find the station investments with the most throughput")
+    add_line_arguments(optimize_parser)
+    optimize_parser.add_argument("--budget", type=int, default=3, help="investment budget in cost units")
+    optimize_parser.add_argument("--cpu-budget", type=float, default=60.0, help="CPU seconds for replications")
+    optimize_parser.add_argument("--target", type=float, default=0.95, help="stop at this probability of correct selection")
+    optimize_parser.add_argument("--indifference", type=float, default=2.0, help="production difference not worth resolving")
+    optimize_parser.add_argument("--top", type=int, default=5)
+    optimize_parser.add_argument("--processes", type=int, default=None)
+    optimize_parser.add_argument("--store", help="SQLite result store reused across runs")
+    optimize_parser.set_defaults(handler=optimize)
+
+    sensitivity_parser = commands.add_parser("sensitivity", help="rank the inputs that drive the output")
+    add_line_arguments(sensitivity_parser)
+    sensitivity_parser.add_argument("--method", default="morris", choices=["morris", "sobol"])
+    sensitivity_parser.add_argument("--samples", type=int, default=None,
+                                    help="Morris trajectories or Sobol sample rows")
+    sensitivity_parser.add_argument("--core-hours", type=float, default=0.01)
+    sensitivity_parser.add_argument("--output", default="production", help="station counter to analyze")
+    sensitivity_parser.add_argument("--plot", action="store_true", help="draw the tornado chart")
+    sensitivity_parser.add_argument("--processes", type=int, default=None)
+    sensitivity_parser.add_argument("--store", help="SQLite result store reused across runs")
+    sensitivity_parser.set_defaults(handler=sensitivity)
+
+    compare_parser = commands.add_parser("compare", help="compare stored scenarios against a baseline")
+    compare_parser.add_argument("--store", required=True, help="SQLite result store written by sweep")
+    compare_parser.add_argument("--model", default="line", choices=["line", "facility"])
+    compare_parser.add_argument("--baseline", default="{}", help="JSON object of the baseline scenario parameters")
+    compare_parser.add_argument("--metric", default="production", help="per-station result to compare")
+    compare_parser.add_argument("--plot", action="store_true", help="draw the comparison dashboard")
+    compare_parser.add_argument("--top", type=int, default=None, help="only plot the best scenarios")
+    compare_parser.set_defaults(handler=compare)
+
+    what_if_parser = commands.add_parser("what-if", help="estimate a scenario, simulating only when the estimate is too rough")
+    add_line_arguments(what_if_parser)
+    what_if_parser.add_argument("--params", default="{}", help="JSON object of model parameter overrides")
+    what_if_parser.add_argument("--tolerance", type=float, default=0.05,
+                                help="largest relative 95%% half-width the estimate may have")
+    what_if_parser.set_defaults(handler=what_if)
+
+    edit_parser = commands.add_parser("edit", help="change station error rates and re-simulate incrementally")
+    add_line_arguments(edit_parser)
+    edit_parser.add_argument("--set", type=edit_arg, action="append", default=[], metavar="STATION=RATE",
+                             help="new error rate for a station, may be repeated")
+    edit_parser.add_argument("--verify", action="store_true", help="time a full run of every edit and compare")
+    edit_parser.set_defaults(handler=edit)
+
+    render_parser = commands.add_parser("render", help="draw the line charts or a DataVisualization chart")
+    render_parser.add_argument("chart", nargs="?", default="line", choices=["line"] + CHARTS)
+    add_line_arguments(render_parser)
+    render_parser.add_argument("--manifest", help="write a replayable run manifest to this JSON path")
+    render_parser.set_defaults(handler=render)
+
+    replay_parser = commands.add_parser("replay", help="run the line on recorded plant durations")
+    replay_parser.add_argument("traces", help="directory of per-station .npy traces")
+    replay_parser.add_argument("--import-log", help="CSV log with station, kind and duration columns to import first")
+    replay_parser.add_argument("--mode", default="replay", choices=["replay", "empirical"],
+                               help="replay the traces in order or resample their distributions")
+    replay_parser.add_argument("--runs", type=int, default=500, help="simulation horizon")
+    replay_parser.add_argument("--seed", type=int, default=None)
+    replay_parser.add_argument("--refill-policy", default="fifo", choices=REFILL_POLICIES)
+    replay_parser.add_argument("--crew-size", type=int, default=None)
+    replay_parser.add_argument("--verbose", action="store_true", help="print every station event")
+    replay_parser.add_argument("--plot", action="store_true", help="draw the charts afterwards")
+    replay_parser.set_defaults(handler=replay)
+
+    bench_parser = commands.add_parser("bench", help="measure the cold start of a numbers-only run")
+    bench_parser.add_argument("--repeat", type=int, default=5)
+    bench_parser.add_argument("--runs", type=int, default=100)
+    bench_parser.add_argument("--budget", type=float, default=COLD_START_BUDGET)
+    bench_parser.add_argument("--mix", action="store_true", help="benchmark the product mix model instead")
+    bench_parser.add_argument("--repairs", action="store_true", help="check that every breakdown is repaired once")
+    bench_parser.add_argument("--mix-types", type=int, default=50)
+    bench_parser.add_argument("--mix-stations", type=int, default=100)
+    bench_parser.add_argument("--mix-runs", type=int, default=2000)
+    bench_parser.set_defaults(handler=bench)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
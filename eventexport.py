@@ -0,0 +1,146 @@
+import csv
+import os
+import queue
+import threading
+
+# pyarrow is optional, without it everything is written as CSV
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+EVENT_COLUMNS = ["time", "station", "event", "value"]
+# Declared up front: inferring it per batch makes an all-integer first batch clash with later floats
+EVENT_SCHEMA = pa.schema([("time", pa.float64()), ("station", pa.int64()), ("event", pa.string()),
+                          ("value", pa.float64())]) if pa is not None else None
+FORMAT_EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow", "csv": ".csv"}
+
+class _TableWriter(object):
+    def __init__(self, path, format, schema=None):
+        self.path = path
+        self.format = format
+        self.schema = schema
+        self.writer = None
+        self.file = None
+
+    def write(self, columns):
+        if self.format == "csv":
+            if self.file is None:
+                self.file = open(self.path, "w", newline="")
+                self.writer = csv.writer(self.file)
+                self.writer.writerow(list(columns))
+            self.writer.writerows(zip(*columns.values()))
+            return
+        table = pa.table(columns, schema=self.schema)
+        if self.writer is None:
+            if self.format == "parquet":
+                self.writer = pq.ParquetWriter(self.path, table.schema)
+            else:
+                self.writer = pa.ipc.new_file(self.path, table.schema)
+        # Every batch handed to the writer becomes its own row group / record batch
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None and self.format != "csv":
+            self.writer.close()
+        if self.file is not None:
+            self.file.close()
+
+class EventExporter(object):
+    def __init__(self, path, format="parquet", row_group_size=50000, max_pending=4):
+        if format not in FORMAT_EXTENSIONS:
+            raise ValueError(f"Unknown export format {format!r}")
+        if pa is None:
+            format = "csv"
+        stem = os.path.splitext(path)[0]
+        self.format = format
+        self.path = stem + FORMAT_EXTENSIONS[format]
+        self.stations_path = stem + "_stations" + FORMAT_EXTENSIONS[format]
+        self.row_group_size = row_group_size
+        self._limit = row_group_size
+        self._reset()
+        self.error = None  # Set by the writer thread when it dies, raised again by close()
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+    def _reset(self):
+        self.times = []
+        self.stations = []
+        self.events = []
+        self.values = []
+
+    def record(self, time, station, event, value=0.0):
+        self.times.append(time)
+        self.stations.append(station)
+        self.events.append(event)
+        self.values.append(value)
+        if len(self.times) >= self._limit:
+            self._flush()
+
+    def _flush(self):
+        if self.error is not None:
+            # Nothing will write it any more, close() reports the error
+            self._reset()
+            return
+        batch = dict(zip(EVENT_COLUMNS, (self.times, self.stations, self.events, self.values)))
+        try:
+            self.queue.put_nowait(("events", batch))
+        except queue.Full:
+            # Writer is behind, keep buffering instead of stalling the simulation
+            self._limit += self.row_group_size
+            return
+        self._limit = self.row_group_size
+        self._reset()
+
+    def _put(self, item):
+        # Blocks while the writer is behind, gives up as soon as the writer thread is gone
+        while self.thread.is_alive():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def write_aggregates(self, columns):
+        self._put(("stations", {name: list(values) for name, values in columns.items()}))
+
+    def close(self):
+        if self.times:
+            batch = dict(zip(EVENT_COLUMNS, (self.times, self.stations, self.events, self.values)))
+            self._put(("events", batch))
+            self._reset()
+        self._put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _write_loop(self):
+        writers = {
+            "events": _TableWriter(self.path, self.format, EVENT_SCHEMA),
+            "stations": _TableWriter(self.stations_path, self.format),
+        }
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                kind, columns = item
+                writers[kind].write(columns)
+        except Exception as error:
+            self.error = error
+        finally:
+            for writer in writers.values():
+                try:
+                    writer.close()
+                except Exception as error:
+                    self.error = self.error or error
@@ -0,0 +1,228 @@
+import math
+import random
+
+import simpy
+
+import manufactoringsim
+from manufactoringsim import DEFAULT_PARAMS, STATION_FIELDS, Product, StationRegistry, WorkStation, \
+    downstream_consumer, stream_seed
+from refillsystem import RefillSystem
+
+# Past this share of live stations an incremental run costs about as much as a full one
+MAX_LIVE_SHARE = 0.5
+
+def at(env, when):
+    # A timeout at an absolute time. now + (when - now) can land an ulp away from the recorded
+    # time, which would be enough to reorder ties, so the delay is nudged until it lands on it
+    delay = when - env.now
+    while env.now + delay < when:
+        delay = math.nextafter(delay, math.inf)
+    while delay > 0 and env.now + delay > when:
+        delay = math.nextafter(delay, -math.inf)
+    return env.timeout(delay)
+
+class GhostStation(object):
+    # Stands in for a station whose inputs did not change. Its only link to the rest of the
+    # line is the refill system, so it replays its recorded refill requests and checks that
+    # every delivery still arrives exactly when it did in the recorded run
+    def __init__(self, env, refill, id, error_rate, requests):
+        self.env = env
+        self.refill = refill
+        self.id = id
+        self.error_rate = error_rate  # Read by the bottleneck refill policy
+        self.requests = requests
+        self.delivered = 0
+        self.diverged = False
+        env.process(self.run())
+
+    def run(self):
+        for requested, delivered in self.requests:
+            yield at(self.env, requested)
+            yield self.refill.request(self)
+            if self.env.now != delivered:
+                self.diverged = True
+                return
+            self.delivered += 1
+
+    def valid(self):
+        # A request still outstanding at the horizon must have been outstanding in the recorded run too
+        expected = sum(1 for _, delivered in self.requests if delivered is not None)
+        return not self.diverged and self.delivered == expected
+
+class FastStation(object):
+    # WorkStation.run() for a station without crew, calendar, tracker or exporter. Between
+    # refill interactions nothing else can touch the station, so it advances its own clock in
+    # plain Python with the same draws and additions, and only steps into the simulation to
+    # request a bin or to see whether an outstanding one has arrived. It is a hand-kept copy of
+    # that loop: a change to one needs the same change in the other, edit --verify checks them
+    def __init__(self, id, env, refill, error_rate, params, rng, horizon):
+        self.id = id
+        self.env = env
+        self.refill = refill
+        self.error_rate = error_rate
+        self.params = params
+        self.rng = rng
+        self.horizon = horizon
+        self.material = params["bin_size"]
+        self.production = 0
+        self.occupancy = 0.0
+        self.downtime = 0.0
+        self.planned_downtime = 0.0
+        self.fixing_time = 0.0
+        self.rejected = 0
+        self.supply_time = 0.0
+        self.pending = None  # Outstanding refill request, cleared on delivery like WorkStation.pending_refill
+        env.process(self.run())
+
+    def _request(self):
+        event = self.refill.request(self)
+        event.callbacks.append(self._refilled)
+        return event
+
+    def _refilled(self, event):
+        self.supply_time += event.value
+        self.material = self.params["bin_size"]
+        self.pending = None
+
+    def _outstanding(self, t):
+        # A bin on its way may land before t, the simulation has to catch up first
+        return self.pending is not None and not self.pending.processed and t > self.env.now
+
+    def run(self):
+        env = self.env
+        rng = self.rng
+        params = self.params
+        threshold = self.refill.predictive_threshold
+        t = env.now
+        while True:
+            duration = max(rng.normalvariate(params["work_time_mean"], params["work_time_sd"]), 0)
+            t = t + duration
+            if t >= self.horizon:
+                return
+            self.occupancy += duration
+
+            if self._outstanding(t):
+                yield at(env, t)
+            if self.material <= 0:
+                if self.pending is None:
+                    if t > env.now:
+                        yield at(env, t)
+                    self.pending = self._request()
+                yield self.pending
+                t = env.now
+            elif self.pending is None and threshold is not None and self.material <= threshold:
+                if t > env.now:
+                    yield at(env, t)
+                self.pending = self._request()
+
+            if rng.random() < self.error_rate:
+                start = t
+                fix_time = rng.expovariate(1 / params["repair_mean"])
+                self.fixing_time += fix_time
+                t = t + fix_time
+                if t >= self.horizon:
+                    return
+                self.downtime += t - start
+
+            if self._outstanding(t):
+                yield at(env, t)
+            if self.material > 0:
+                self.production += 1
+                self.material -= 1
+                if rng.random() <= params["rejection_probability"]:
+                    self.rejected += 1
+                    self.production -= 1
+
+class IncrementalLine(object):
+    # The line of run_simulation() without a maintenance crew, kept in memory so an edit to a
+    # few error rates only re-simulates those stations. Stations share nothing but the refill
+    # system, so the others are replayed as ghosts from their recorded refill requests. A ghost
+    # whose deliveries move has changed too: it goes live and the edit is simulated again,
+    # until every ghost checks out. On a line with a busy refill queue one edit usually moves
+    # every station's deliveries: nothing is reused and the edit is a full run, only faster
+    # than run_simulation() because the live stations are FastStations.
+    # Results are bit-identical to run_simulation() with the same seed
+    def __init__(self, num_stations, error_rates, num_runs, refill_policy="fifo", params=None, seed=None):
+        self.num_stations = num_stations
+        self.error_rates = list(error_rates)
+        self.num_runs = num_runs
+        self.refill_policy = refill_policy
+        self.params = dict(DEFAULT_PARAMS, **(params or {}))
+        self.seed = seed if seed is not None else random.getrandbits(64)
+        self.registry = StationRegistry(num_stations)
+        for _ in range(num_stations):
+            self.registry.add()
+        self.trace = {}
+        self.refill_stats = None
+        self.simulated = []
+        self.rounds = 0
+        self.update(self.error_rates, live=range(num_stations))
+
+    def update(self, error_rates, live=None):
+        # Returns the indexes of the stations that had to be simulated again
+        error_rates = list(error_rates)
+        if live is None:
+            live = [i for i, (old, new) in enumerate(zip(self.error_rates, error_rates)) if old != new]
+        self.error_rates = error_rates
+        live = set(live)
+        self.rounds = 0
+        while True:
+            if len(live) > MAX_LIVE_SHARE * self.num_stations:
+                live = set(range(self.num_stations))
+            stations, refill, invalid = self._simulate(live)
+            self.rounds += 1
+            if not invalid:
+                break
+            live |= invalid
+
+        for station in stations:
+            for name, _ in STATION_FIELDS:
+                self.registry.view(name)[station.id - 1] = getattr(station, name)
+        self.trace = refill.trace
+        self.refill_stats = refill.stats()
+        self.simulated = sorted(live)
+        return self.simulated
+
+    def set_error_rate(self, station, rate):
+        # station is the 1-based Work Station id
+        error_rates = list(self.error_rates)
+        error_rates[station - 1] = rate
+        return self.update(error_rates)
+
+    def _simulate(self, live):
+        env = simpy.Environment()
+        refill = RefillSystem(env, capacity=self.params["refill_capacity"], refill_time=self.params["refill_time"],
+                              policy=self.refill_policy)
+        refill.trace = {}
+        stations = []
+        ghosts = []
+        verbose, manufactoringsim.VERBOSE = manufactoringsim.VERBOSE, False
+        try:
+            for i in range(self.num_stations):
+                rng = random.Random(stream_seed(self.seed, "station", i + 1))
+                if i not in live:
+                    ghosts.append(GhostStation(env, refill, i + 1, self.error_rates[i], self.trace.get(i + 1, [])))
+                elif i == 0:
+                    # The first station also runs the Product loop. Both loops share its material and
+                    # its stream and can meet at the same instant, so it stays a full WorkStation with
+                    # the same downstream events as in run_simulation()
+                    downstream = simpy.Store(env) if self.num_stations > 1 else None
+                    stations.append(WorkStation(1, env, refill, self.error_rates[0], downstream, StationRegistry(1),
+                                                None, None, self.params, None, None, rng))
+                    if downstream is not None:
+                        env.process(downstream_consumer(env, downstream))
+                else:
+                    stations.append(FastStation(i + 1, env, refill, self.error_rates[i], self.params, rng,
+                                                self.num_runs))
+            if 0 in live:
+                Product(env, stations)
+            env.run(until=self.num_runs)
+        finally:
+            manufactoringsim.VERBOSE = verbose
+        return stations, refill, {ghost.id - 1 for ghost in ghosts if not ghost.valid()}
+
+    def result(self):
+        # Same layout as replication.line_result()
+        result = {name: self.registry.view(name).tolist() for name, _ in STATION_FIELDS}
+        result["refill"] = self.refill_stats
+        return result
@@ -0,0 +1,162 @@
+import builtins
+import collections
+import random
+import sys
+import threading
+import time
+
+import simpy
+from tabulate import tabulate
+
+# Functions whose stacks the sampler keeps, everything else is folded into "other"
+PROFILED_FUNCTIONS = (
+    "WorkStation.run",
+    "WorkStation.refill_material",
+    "WorkStation.repair",
+    "ManufacturingFacility.production_process",
+)
+TIMED_CALLS = [
+    (random.Random, "normalvariate"),
+    (random.Random, "expovariate"),
+    (random.Random, "random"),
+    (random, "normalvariate"),
+    (random, "expovariate"),
+    (random, "random"),
+    (builtins, "print"),
+]
+
+def _event_key(event):
+    # Name an event after the process it is going to resume, e.g. "Timeout:run"
+    owner = ""
+    for callback in event.callbacks or ():
+        process = getattr(callback, "__self__", None)
+        if isinstance(process, simpy.events.Process):
+            owner = process.name
+            break
+    if isinstance(event, simpy.events.Process) and not owner:
+        owner = event.name
+    return f"{type(event).__name__}:{owner}" if owner else type(event).__name__
+
+class InstrumentedEnvironment(simpy.Environment):
+    # Only pay for the counters when this environment is used instead of simpy.Environment
+    def __init__(self, initial_time=0):
+        super().__init__(initial_time)
+        self.event_counts = collections.Counter()
+        self.event_times = collections.defaultdict(float)
+
+    def step(self):
+        key = _event_key(self._queue[0][3]) if self._queue else "empty"
+        start = time.perf_counter()
+        try:
+            super().step()
+        finally:
+            self.event_times[key] += time.perf_counter() - start
+            self.event_counts[key] += 1
+
+class CallTimers(object):
+    def __init__(self, calls=TIMED_CALLS):
+        self.calls = calls
+        self.counts = collections.Counter()
+        self.times = collections.defaultdict(float)
+        self._originals = []
+
+    def _wrap(self, name, function):
+        counts, times, clock = self.counts, self.times, time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                times[name] += clock() - start
+                counts[name] += 1
+        return timed
+
+    def __enter__(self):
+        for module, attr in self.calls:
+            original = getattr(module, attr)
+            # Methods inherited by a class are restored by deleting the override
+            self._originals.append((module, attr, original, attr in vars(module)))
+            setattr(module, attr, self._wrap(f"{module.__name__}.{attr}", original))
+        return self
+
+    def __exit__(self, *exc):
+        for module, attr, original, owned in reversed(self._originals):
+            if owned:
+                setattr(module, attr, original)
+            else:
+                delattr(module, attr)
+        self._originals = []
+
+class StackSampler(object):
+    def __init__(self, interval=0.001, functions=PROFILED_FUNCTIONS):
+        self.interval = interval
+        self.functions = set(functions)
+        self.stacks = collections.Counter()
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(getattr(code, "co_qualname", code.co_name))
+                frame = frame.f_back
+            names.reverse()
+            if self.functions.intersection(names):
+                self.stacks[";".join(names)] += 1
+            else:
+                self.stacks["other"] += 1
+
+    def __enter__(self):
+        self._thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def write_folded(self, path):
+        # Brendan Gregg's folded format, readable by flamegraph.pl and speedscope
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+class Instrumentation(object):
+    def __init__(self, env, interval=0.001):
+        self.env = env
+        self.timers = CallTimers()
+        self.sampler = StackSampler(interval)
+
+    def __enter__(self):
+        self.timers.__enter__()
+        self.sampler.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        self.sampler.__exit__(*exc)
+        self.timers.__exit__(*exc)
+
+    def rows(self):
+        rows = []
+        for key, count in getattr(self.env, "event_counts", {}).items():
+            rows.append([key, count, self.env.event_times[key]])
+        for key, count in self.timers.counts.items():
+            rows.append([key + "()", count, self.timers.times[key]])
+        rows.sort(key=lambda row: row[2], reverse=True)
+        return rows
+
+    def report(self):
+        print(f"\nWall time: {self.elapsed:.3f} s")
+        print(tabulate(self.rows(), headers=["Event / Call", "Count", "Total Time (s)"]))
+
+    def write_folded(self, path):
+        self.sampler.write_folded(path)
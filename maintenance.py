@@ -0,0 +1,65 @@
+import random
+
+import simpy
+
+class MaintenanceCrew(object):
+    def __init__(self, env, size=1):
+        self.env = env
+        self.size = size
+        self.resource = simpy.Resource(env, capacity=size)
+
+        # Running statistics, updated in O(1) per request / release
+        self.repairs = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.max_queue = 0
+        self._queue_area = 0.0
+        self._busy_area = 0.0
+        self._start = env.now
+        self._last = env.now
+
+    def _advance(self):
+        now = self.env.now
+        elapsed = now - self._last
+        self._queue_area += elapsed * len(self.resource.queue)
+        self._busy_area += elapsed * self.resource.count
+        self._last = now
+
+    def repair(self, fix_time):
+        self._advance()
+        requested = self.env.now
+        with self.resource.request() as req:
+            self.max_queue = max(self.max_queue, len(self.resource.queue))
+            yield req
+            wait = self.env.now - requested
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            yield self.env.timeout(fix_time)
+            self.repairs += 1
+            self._advance()
+
+    def stats(self):
+        self._advance()
+        elapsed = (self.env.now - self._start) or 1
+        return {
+            "crew_size": self.size,
+            "repairs": self.repairs,
+            "mean_wait": self.total_wait / self.repairs if self.repairs else 0,
+            "max_wait": self.max_wait,
+            "mean_queue_length": self._queue_area / elapsed,
+            "max_queue_length": self.max_queue,
+            "utilization": self._busy_area / (self.size * elapsed),
+        }
+
+def failures(env, station, mean_time_between_failures, rng=random):
+    # Time between failures is exponential, the station is interrupted if it is
+    # processing and otherwise repairs before it starts its next item
+    while True:
+        yield env.timeout(rng.expovariate(1 / mean_time_between_failures))
+        yield station.breakdown()
+
+def unmatched_repairs(stations):
+    # Ids of stations that did not repair exactly once per breakdown. A breakdown at the
+    # horizon whose repair has not started yet is still owed its repair
+    return [station.id for station in stations
+            if station.repairs != station.breakdowns - (station.broken and not station.repairing)]
@@ -0,0 +1,80 @@
+import argparse
+import hashlib
+import json
+import platform
+import sys
+
+import numpy as np
+import simpy
+
+import manufactoringsim
+from replication import MODELS, ResultStore, resolve_params
+
+MANIFEST_VERSION = 1
+
+def result_hash(result):
+    # JSON keeps the shortest repr of every float, so equal hashes mean bit-identical results
+    return hashlib.sha256(json.dumps(result, sort_keys=True).encode()).hexdigest()
+
+def library_versions():
+    return {
+        "python": platform.python_version(),
+        "simpy": simpy.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+    }
+
+def rng_streams(model, params, seed):
+    if model == "line":
+        streams = {f"station {i}": manufactoringsim.stream_seed(seed, "station", i)
+                   for i in range(1, params["num_stations"] + 1)}
+        if params["crew_size"]:
+            streams.update({f"failures {i}": manufactoringsim.stream_seed(seed, "failures", i)
+                            for i in range(1, params["num_stations"] + 1)})
+        return manufactoringsim.RNG_ALGORITHM, streams
+    return "PCG64 (numpy.random.default_rng)", {"facility": seed}
+
+def build_manifest(model, params, seed, result):
+    params = resolve_params(model, params)
+    algorithm, streams = rng_streams(model, params, seed)
+    return {
+        "manifest_version": MANIFEST_VERSION,
+        "model": model,
+        "params": params,
+        "seed": seed,
+        "rng": {"algorithm": algorithm, "streams": streams},
+        "versions": library_versions(),
+        "result_hash": result_hash(result),
+    }
+
+def replay(manifest):
+    result = MODELS[manifest["model"]](manifest["params"], manifest["seed"])
+    return result, result_hash(result) == manifest["result_hash"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a run from its reproducibility manifest")
+    parser.add_argument("source", help="manifest JSON file, or a result store database with --job")
+    parser.add_argument("--job", help="job id of one replication in the result store")
+    args = parser.parse_args()
+
+    if args.job:
+        manifest = ResultStore(args.source).manifest(args.job)
+        if manifest is None:
+            sys.exit(f"No replication {args.job} in {args.source}")
+    else:
+        with open(args.source) as f:
+            manifest = json.load(f)
+
+    versions = library_versions()
+    for name, version in manifest["versions"].items():
+        if versions.get(name) != version:
+            print(f"Warning: {name} is {versions.get(name)}, the run used {version}")
+    result, matches = replay(manifest)
+    print(f"Replayed {manifest['model']} with seed {manifest['seed']}: result hash {result_hash(result)}")
+    if not matches:
+        print(f"MISMATCH, the manifest records {manifest['result_hash']}")
+        sys.exit(1)
+    print("Bit-exact match")
+
+if __name__ == "__main__":
+    main()
@@ -1,63 +1,264 @@
 import simpy
 import random
+import hashlib
+import numpy as np
 from tabulate import tabulate
-import matplotlib.pyplot as plt
+from refillsystem import RefillSystem
+from maintenance import MaintenanceCrew, failures
+from statetracker import STATES, StateTracker, oee
 
-random.seed(42)
+# Set to False to silence the per-event log lines on long runs
+VERBOSE = True
+
+# Every random stream (one per station, one per failure process, ...) is seeded
+# from the run's root seed, so any run or single replication can be replayed alone
+RNG_ALGORITHM = "MT19937 (random.Random)"
+
+def stream_seed(root_seed, *names):
+    key = "/".join(str(part) for part in (root_seed,) + names)
+    return int.from_bytes(hashlib.sha256(key.encode()).digest()[:8], "little")
+
+# Model parameters, run_simulation(params=...) overrides any of them per run
+DEFAULT_PARAMS = {
+    "work_time_mean": 4,
+    "work_time_sd": 1,
+    "repair_mean": 3,
+    "rejection_probability": 0.05,
+    "bin_size": 25,
+    "refill_time": 1.5,
+    "refill_capacity": 3,
+}
+
+# Per-station counters are plain slots while the line runs and are copied into
+# contiguous arrays indexed by station slot at the end of a run or for a snapshot,
+# so KPIs can be vectorized without a numpy scalar write on every update
+STATION_FIELDS = [
+    ("material", np.int64),
+    ("production", np.int64),
+    ("occupancy", np.float64),
+    ("downtime", np.float64),
+    ("planned_downtime", np.float64),
+    ("fixing_time", np.float64),
+    ("rejected", np.int64),
+    ("supply_time", np.float64),
+]
+
+class StationRegistry(object):
+    def __init__(self, capacity=8):
+        self.size = 0
+        for name, dtype in STATION_FIELDS:
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+
+    def add(self):
+        if self.size == len(self.production):
+            self._grow(max(1, 2 * self.size))
+        index = self.size
+        self.size += 1
+        return index
+
+    def _grow(self, capacity):
+        for name, _ in STATION_FIELDS:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def sync(self, stations):
+        indexes = [station.index for station in stations]
+        for name, _ in STATION_FIELDS:
+            getattr(self, name)[indexes] = [getattr(station, name) for station in stations]
+
+    def view(self, name):
+        return getattr(self, name)[:self.size]
+
+    def columns(self, ids):
+        columns = {"station": list(ids)}
+        for name, _ in STATION_FIELDS:
+            columns[name] = self.view(name).tolist()
+        return columns
+
+    def totals(self):
+        return {name: self.view(name).sum().item() for name, _ in STATION_FIELDS}
 
 class WorkStation(object):
-    def __init__(self, id, env, refill, error_rate, downstream=None):
+    __slots__ = ("id", "env", "refill", "error_rate", "downstream", "registry", "index", "exporter",
+                 "pending_refill", "crew", "preempted", "processing", "broken", "repairing", "repaired", "params",
+                 "breakdowns", "repairs",
+                 "tracker", "calendar", "rng", "action", "states", "state_slots") \
+        + tuple(name for name, _ in STATION_FIELDS)
+
+    def __init__(self, id, env, refill, error_rate, downstream=None, registry=None, exporter=None, crew=None,
+                 params=DEFAULT_PARAMS, tracker=None, calendar=None, rng=None, states=None, preempted=None):
         self.id = id
         self.env = env
         self.refill = refill
         self.error_rate = error_rate
         self.downstream = downstream
-        self.material = 25
-        self.production = 0
-        self.occupancy = 0
-        self.downtime = 0
-        self.fixing_time = 0
-        self.rejected = 0
-        self.supply_time = 0
+        self.registry = registry if registry is not None else StationRegistry(1)
+        self.index = self.registry.add()
+        self.exporter = exporter
+        self.pending_refill = None
+        self.crew = crew
+        # Preempted stations are broken down by a failures() process instead of per item
+        self.preempted = crew is not None if preempted is None else preempted
+        self.processing = False
+        self.broken = False
+        self.repairing = False
+        self.repaired = None
+        self.breakdowns = 0
+        self.repairs = 0
+        self.params = params
+        self.tracker = tracker
+        self.calendar = calendar
+        self.rng = rng if rng is not None else random  # Falls back to the global stream
+        self.states = states
+        self.state_slots = {}  # One state slot per run() loop, the first station has two
+        for name, dtype in STATION_FIELDS:
+            setattr(self, name, dtype(0).item())
+        self.material = params["bin_size"]
         self.action = env.process(self.run())
 
     def run(self):
+        if self.states is not None:
+            self.state_slots[self.env.active_process] = self.states.add(self.id, "busy")
         while True:
             try:
-                yield self.env.timeout(random.normalvariate(4, 1))
-                self.occupancy += random.normalvariate(4, 1)
-                if self.material <= 0:
-                    yield self.env.process(self.refill_material())
-                if random.random() < self.error_rate:
-                    start = self.env.now
-                    yield self.env.process(self.repair())
-                    self.downtime += (self.env.now - start)
+                if self.calendar is not None:
+                    yield from self.wait_for_shift()
+                if self.broken:
+                    yield from self.fix_breakdown()
+                params = self.params
+                entry = self.env.now
+                if self.tracker is not None:
+                    product = self.tracker.new_product(entry)
+                duration = max(self.rng.normalvariate(params["work_time_mean"], params["work_time_sd"]), 0)  # Ensure non-negative work time
+                yield from self.work(duration)
+                self.occupancy += duration
+                yield from self.ensure_material()
+                yield from self.check_failure()
                 if self.material > 0:
                     self.production += 1
                     self.material -= 1
-                    print(f"Work Station {self.id} produced item {self.production}")
-                    if random.random() <= 0.05:
-                       print(f"Work Station {self.id} item {self.production} REJECTED")
+                    self.log("produced", f"Work Station {self.id} produced item {self.production}")
+                    if self.tracker is not None:
+                        self.tracker.record(product, self.id, entry, self.env.now)
+                        self.tracker.finish(product, self.env.now)
+                    if self.rng.random() <= params["rejection_probability"]:
+                       self.log("rejected", f"Work Station {self.id} item {self.production} REJECTED")
                        self.rejected += 1
                        self.production -= 1  
                     if self.downstream is not None:
+                        self.enter("blocked")
                         yield self.downstream.put(self.id)  # Yield the put operation
             except simpy.Interrupt:
-                print(f"Work Station {self.id} is interrupted for repair.")
+                self.log("interrupted", f"Work Station {self.id} is interrupted for repair.")
+                yield from self.fix_breakdown()
+
+    def wait_for_shift(self):
+        # Off-shift time and planned maintenance count as planned downtime
+        resume = self.calendar.next_available(self.id, self.env.now)
+        if resume > self.env.now:
+            start = self.env.now
+            self.enter("idle")
+            self.log("closed", f"Work Station {self.id} is closed until {resume}.", resume - start)
+            yield self.env.timeout(resume - start)
+            self.planned_downtime += (resume - start)
+
+    def ensure_material(self):
+        if self.material <= 0:
+            if self.pending_refill is None:
+                self.pending_refill = self.env.process(self.refill_material())
+            self.enter("starved")
+            yield self.pending_refill
+            self.pending_refill = None
+        elif self.pending_refill is None and self.refill.predictive_threshold is not None \
+                and self.material <= self.refill.predictive_threshold:
+            # Order the next bin early so it arrives before the station runs dry
+            self.pending_refill = self.env.process(self.refill_material())
+
+    def check_failure(self):
+        # Per-item breakdowns, only used when no failures() process preempts the station
+        if not self.preempted and self.rng.random() < self.error_rate:
+            self.breakdowns += 1
+            start = self.env.now
+            self.enter("down")
+            yield self.env.process(self.repair())
+            self.downtime += (self.env.now - start)
+
+    def work(self, duration):
+        # Processing can be preempted by a breakdown, the remaining work resumes after the repair.
+        # Only the station's own loop is interrupted, so only it owns the processing flag: the
+        # Product loop of the first station must not clear it while the own loop is working
+        main = self.env.active_process is self.action
+        while True:
+            start = self.env.now
+            self.enter("busy")
+            if main:
+                self.processing = True
+            try:
+                yield self.env.timeout(duration)
+                return
+            except simpy.Interrupt:
+                self.processing = False
+                duration -= self.env.now - start
+                self.log("interrupted", f"Work Station {self.id} is interrupted for repair.")
+                yield from self.fix_breakdown()
+            finally:
+                if main:
+                    self.processing = False
+
+    def breakdown(self):
+        self.breakdowns += 1
+        self.repaired = self.env.event()
+        if self.processing:
+            self.action.interrupt("breakdown")
+        else:
+            self.broken = True
+        return self.repaired
+
+    def fix_breakdown(self):
+        self.enter("down")
+        if self.repairing:
+            # The first station's other loop is already repairing this breakdown
+            yield self.repaired
+            return
+        start = self.env.now
+        self.broken = True  # Holds the other loop of the first station until the repair is done
+        self.repairing = True
+        yield self.env.process(self.repair())
+        self.downtime += (self.env.now - start)
+        self.broken = False
+        self.repairing = False
+        if self.repaired is not None:
+            repaired, self.repaired = self.repaired, None
+            repaired.succeed()
+
+    def enter(self, state):
+        if self.states is not None:
+            self.states.set(self.state_slots[self.env.active_process], state)
+
+    def log(self, event, message, value=0.0):
+        if VERBOSE:
+            print(message)
+        if self.exporter is not None:
+            self.exporter.record(self.env.now, self.id, event, value)
 
     def refill_material(self):
-        with self.refill.request() as req:
-            yield req
-            yield self.env.timeout(1.5)
-            self.supply_time += 1.5
-            print(f"Refill full at Work Station {self.id}.")
-            self.material = 25
+        duration = yield self.refill.request(self)
+        self.supply_time += duration
+        self.log("refilled", f"Refill full at Work Station {self.id}.", duration)
+        self.material = self.params["bin_size"]
+        self.pending_refill = None  # Lets an early (predictive) order be followed by the next one
 
     def repair(self):
-        fix_time = random.expovariate(1/3)
+        self.repairs += 1
+        fix_time = self.rng.expovariate(1 / self.params["repair_mean"])
         self.fixing_time += fix_time
-        yield self.env.timeout(fix_time)
-        print(f"Work Station {self.id} is repaired at {self.env.now}.")
+        if self.crew is None:
+            yield self.env.timeout(fix_time)
+        else:
+            yield self.env.process(self.crew.repair(fix_time))
+        self.log("repaired", f"Work Station {self.id} is repaired at {self.env.now}.", fix_time)
 
 class Product(object):
     def __init__(self, env, stations):
@@ -69,43 +270,70 @@ class Product(object):
         while True:
             yield self.env.process(self.stations[0].run())
 
-def run_simulation(env, num_stations, error_rates, num_runs):
-    refill = simpy.Resource(env, capacity=3)
+def run_simulation(env, num_stations, error_rates, num_runs, exporter=None, refill_policy="fifo",
+                   crew_size=None, params=None, tracker=None, calendar=None, seed=None, metrics=None, streams=None,
+                   failure_means=None):
+    params = dict(DEFAULT_PARAMS, **(params or {}))
+    if seed is None:
+        seed = random.getrandbits(64)
+    if streams is None:
+        # streams(name, station) hands out every random stream, trace replay swaps in its own
+        streams = lambda name, station: random.Random(stream_seed(seed, name, station))
+    states = StateTracker(env)
+    refill = RefillSystem(env, capacity=params["refill_capacity"], refill_time=params["refill_time"],
+                          policy=refill_policy, states=states)
+    crew = MaintenanceCrew(env, crew_size) if crew_size else None
+    if failure_means is None:
+        # With a maintenance crew, breakdowns interrupt the stations instead of being drawn per item.
+        # failure_means ({station id: mean time between failures}) picks the interrupted stations one by one
+        failure_means = {}
+        preempted = set()
+        if crew is not None:
+            # Mean time between failures in work time units
+            failure_means = {i + 1: params["work_time_mean"] / rate for i, rate in enumerate(error_rates) if rate > 0}
+            preempted = set(range(1, num_stations + 1))
+    else:
+        preempted = set(failure_means)
+    registry = StationRegistry(num_stations)
     stations = []
     downstream = None
     for i in range(num_stations):
         downstream = simpy.Store(env) if i < num_stations - 1 else None
-        station = WorkStation(i + 1, env, refill, error_rates[i], downstream)
+        station = WorkStation(i + 1, env, refill, error_rates[i], downstream, registry, exporter, crew,
+                              params, tracker, calendar, streams("station", i + 1), states, i + 1 in preempted)
         if downstream is not None:
             env.process(downstream_consumer(env, downstream))  # Start downstream consumer process
+        if i + 1 in failure_means:
+            env.process(failures(env, station, failure_means[i + 1], streams("failures", i + 1)))
         stations.append(station)
     product = Product(env, stations)
+    if metrics is not None:
+        metrics.attach(stations)
     env.run(until=num_runs)
+    registry.sync(stations)
+    if exporter is not None:
+        exporter.write_aggregates(registry.columns([station.id for station in stations]))
     return stations
 
 def downstream_consumer(env, downstream):
     while True:
         item = yield downstream.get()  # Wait for an item from upstream
-        print(f"Downstream received item {item} at {env.now}")
-
-def main():
-    num_stations = 6
-    error_rates = [0.20, 0.10, 0.15, 0.05, 0.07, 0.10]
-    num_runs = 500
-
-    env = simpy.Environment()
-    stations = run_simulation(env, num_stations, error_rates, num_runs)
+        if VERBOSE:
+            print(f"Downstream received item {item} at {env.now}")
 
+def print_report(stations, num_stations, ideal_cycle_time=None):
     workstation_data = []
-    total_production = sum(station.production for station in stations)
-    total_rejected = sum(station.rejected for station in stations)
-    total_supply_time = sum(station.supply_time for station in stations)
-    total_occupancy = sum(station.occupancy for station in stations)
-    total_downtime = sum(station.downtime for station in stations)
-    total_fixing_time = sum(station.fixing_time for station in stations)
+    totals = stations[0].registry.totals()
+    total_production = totals["production"]
+    total_rejected = totals["rejected"]
+    total_supply_time = totals["supply_time"]
+    total_occupancy = totals["occupancy"]
+    total_downtime = totals["downtime"]
+    total_fixing_time = totals["fixing_time"]
+    total_planned_downtime = totals["planned_downtime"]
     
     for station in stations:
-        avg_occupancy = station.occupancy / station.production
+        avg_occupancy = station.occupancy / station.production if station.production != 0 else 0
         avg_downtime = station.downtime / num_stations
         workstation_data.append([
             f"Work Station {station.id}",
@@ -130,7 +358,8 @@ def main():
         ["Total Occupancy", total_occupancy],
         ["Average Occupancy Per Product", avg_occupancy],
         ["Total Downtime", total_downtime],
-        ["Average Downtime Per Workstation", avg_downtime]
+        ["Average Downtime Per Workstation", avg_downtime],
+        ["Total Planned Downtime", total_planned_downtime]
     ]
 
     print("\n-----------------------------------------------")
@@ -148,14 +377,55 @@ def main():
             station.production,
             station.fixing_time,
             station.downtime,
+            station.planned_downtime,
             station.occupancy / station.production if station.production != 0 else 0
         ])
 
-    headers = ["Workstation", "Production", "Fixing Time", "Downtime", "Occupancy"]
+    headers = ["Workstation", "Production", "Fixing Time", "Unplanned Downtime", "Planned Downtime", "Occupancy"]
 
     print("Workstation Data:")
     print(tabulate(workstation_data, headers=headers))
 
+    refill_stats = stations[0].refill.stats()
+    print("\nRefill Queue:")
+    print(tabulate([[name.replace("_", " ").title(), value] for name, value in refill_stats.items()]))
+    if stations[0].crew is not None:
+        print("\nMaintenance Crew:")
+        print(tabulate([[name.replace("_", " ").title(), value] for name, value in stations[0].crew.stats().items()]))
+    if stations[0].states is not None:
+        print_state_report(stations, ideal_cycle_time)
+
+def print_state_report(stations, ideal_cycle_time=None):
+    # ideal_cycle_time is a number or one per station, the nominal mean work time by default
+    states = stations[0].states
+    owners, durations = states.totals()
+    rows = {owner: i for i, owner in enumerate(owners)}
+    station_rows = [rows[station.id] for station in stations]
+    fractions = durations / np.maximum(durations.sum(axis=1, keepdims=True), 1e-12)
+    good = np.array([station.production for station in stations], dtype=float)
+    total = good + [station.rejected for station in stations]
+    if ideal_cycle_time is None:
+        ideal_cycle_time = stations[0].params["work_time_mean"]
+    availability, performance, quality, overall = oee(durations[station_rows], good, total, ideal_cycle_time)
+    columns = [STATES.index(state) for state in ("busy", "starved", "down", "blocked", "idle")]
+    state_data = []
+    for k, station in enumerate(stations):
+        state_data.append([f"Work Station {station.id}"] + list(100 * fractions[station_rows[k], columns])
+                          + [availability[k], performance[k], quality[k], overall[k]])
+    print("\nStation States and OEE:")
+    print(tabulate(state_data, headers=["Workstation", "Busy %", "Starved %", "Down %", "Blocked %", "Idle %",
+                                        "Availability", "Performance", "Quality", "OEE"], floatfmt=".3f"))
+    if "Refill" in rows:
+        print(f"\nRefill Server Utilization: {fractions[rows['Refill'], STATES.index('refilling')]:.3f}")
+
+def plot_results(stations, num_stations):
+    # matplotlib is only imported when charts are drawn, numbers-only runs skip it
+    import matplotlib.pyplot as plt
+
+    totals = stations[0].registry.totals()
+    total_production = totals["production"]
+    total_rejected = totals["rejected"]
+
     # Generate pie chart
     labels = ['Total Production', 'Total Rejected']
     sizes = [total_production, total_rejected]
@@ -223,5 +493,15 @@ def main():
     plt.tight_layout()
     plt.show()
 
+def main():
+    num_stations = 6
+    error_rates = [0.20, 0.10, 0.15, 0.05, 0.07, 0.10]
+    num_runs = 500
+
+    env = simpy.Environment()
+    stations = run_simulation(env, num_stations, error_rates, num_runs, seed=42)
+    print_report(stations, num_stations)
+    plot_results(stations, num_stations)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
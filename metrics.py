@@ -0,0 +1,158 @@
+import http.server
+import threading
+import time
+
+import simpy
+import simpy.rt
+
+from manufactoringsim import STATION_FIELDS
+
+# Station counters that only grow, everything else in STATION_FIELDS is exported as a gauge
+COUNTER_FIELDS = {
+    "production": "Items produced",
+    "rejected": "Items rejected",
+    "downtime": "Time spent broken down",
+    "planned_downtime": "Time spent off shift or in planned maintenance",
+    "fixing_time": "Repair time drawn for breakdowns",
+    "supply_time": "Time spent waiting for refill deliveries",
+    "occupancy": "Processing time",
+}
+GAUGE_FIELDS = {
+    "material": "Items left in the station's bin",
+}
+PREFIX = "manufacturing"
+
+class CountingEnvironment(simpy.Environment):
+    # One integer increment per event, cheap enough to leave on for long runs
+    def __init__(self, initial_time=0, **kwargs):
+        super().__init__(initial_time, **kwargs)
+        self.events = 0
+
+    def step(self):
+        self.events += 1
+        super().step()
+
+class CountingRealtimeEnvironment(CountingEnvironment, simpy.rt.RealtimeEnvironment):
+    pass
+
+def clock_lag(env):
+    # How long the next event is overdue against the wall clock, in simulation time units.
+    # Waiting for an event that is still in the future is being on time, not lagging
+    if not isinstance(env, simpy.rt.RealtimeEnvironment):
+        return 0.0
+    return max(env.env_start + (time.monotonic() - env.real_start) / env.factor - env.peek(), 0.0)
+
+class MetricsServer(object):
+    # A simpy process copies the station arrays into a new snapshot every `interval` time
+    # units and swaps it in with a single reference assignment. The HTTP thread only ever
+    # reads a finished snapshot, so scraping takes no lock and never touches live state
+    def __init__(self, env, port=9464, host="127.0.0.1", interval=1.0):
+        self.env = env
+        self.interval = interval
+        self.snapshot = None
+        self._text = None  # Rendered exposition text and the snapshot it belongs to
+        self._stations = None
+        self._last = None
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = server.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def attach(self, stations):
+        self._stations = stations
+        self._take_snapshot()
+        self.env.process(self._collect())
+
+    def _collect(self):
+        while True:
+            yield self.env.timeout(self.interval)
+            self._take_snapshot()
+
+    def _take_snapshot(self):
+        stations = self._stations
+        registry = stations[0].registry
+        registry.sync(stations)
+        refill = stations[0].refill
+        wall = time.perf_counter()
+        events = getattr(self.env, "events", None)
+        rate = 0.0
+        if events is not None and self._last is not None and wall > self._last[1]:
+            rate = (events - self._last[0]) / (wall - self._last[1])
+        self._last = (events, wall)
+        self.snapshot = {
+            "stations": [str(station.id) for station in stations],
+            "fields": {name: registry.view(name).copy() for name, _ in STATION_FIELDS},
+            "refill_queue_length": len(refill.queue),
+            "refill_busy": refill.busy,
+            "refill_requests": refill.requests,
+            "refill_deliveries": refill.deliveries,
+            "simulation_time": self.env.now,
+            "events": events,
+            "events_per_second": rate,
+            "taken_at": wall,
+        }
+
+    def render(self):
+        snapshot = self.snapshot
+        if snapshot is None:
+            return ""
+        cached = self._text
+        if cached is None or cached[0] is not snapshot:
+            cached = self._text = (snapshot, self._render(snapshot))
+        # Lag and snapshot age change between scrapes, the rest is rendered once per snapshot
+        return cached[1] + "".join([
+            metric("simulation_clock_lag", "gauge", "Simulation time units behind the wall clock",
+                   [("", clock_lag(self.env))]),
+            metric("snapshot_age_seconds", "gauge", "Wall seconds since the metrics were collected",
+                   [("", time.perf_counter() - snapshot["taken_at"])]),
+        ])
+
+    def _render(self, snapshot):
+        lines = []
+        labels = [f'{{station="{station}"}}' for station in snapshot["stations"]]
+        for name, _ in STATION_FIELDS:
+            values = snapshot["fields"][name].tolist()
+            if name in COUNTER_FIELDS:
+                lines.append(metric(f"station_{name}_total", "counter", COUNTER_FIELDS[name], zip(labels, values)))
+            else:
+                lines.append(metric(f"station_{name}", "gauge", GAUGE_FIELDS[name], zip(labels, values)))
+        lines.append(metric("refill_queue_length", "gauge", "Refill requests waiting for a server",
+                            [("", snapshot["refill_queue_length"])]))
+        lines.append(metric("refill_busy_servers", "gauge", "Refill servers out on a delivery",
+                            [("", snapshot["refill_busy"])]))
+        lines.append(metric("refill_requests_total", "counter", "Refill requests", [("", snapshot["refill_requests"])]))
+        lines.append(metric("refill_deliveries_total", "counter", "Refill deliveries",
+                            [("", snapshot["refill_deliveries"])]))
+        lines.append(metric("simulation_time", "gauge", "Simulation clock", [("", snapshot["simulation_time"])]))
+        if snapshot["events"] is not None:
+            lines.append(metric("simulation_events_total", "counter", "Events processed", [("", snapshot["events"])]))
+            lines.append(metric("simulation_events_per_second", "gauge", "Events processed per wall second",
+                                [("", snapshot["events_per_second"])]))
+        return "".join(lines)
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def metric(name, kind, help, samples):
+    lines = [f"# HELP {PREFIX}_{name} {help}\n", f"# TYPE {PREFIX}_{name} {kind}\n"]
+    for labels, value in samples:
+        lines.append(f"{PREFIX}_{name}{labels} {float(value)!r}\n")
+    return "".join(lines)
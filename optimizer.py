@@ -0,0 +1,195 @@
+import itertools
+import math
+
+import numpy as np
+from tabulate import tabulate
+
+from manufactoringsim import DEFAULT_PARAMS
+from replication import CpuBudget
+
+# Investments on offer: halving one station's error rate, or a bigger material bin on every station
+ERROR_STEP_FACTOR = 0.5
+ERROR_STEP_COST = 1
+BIN_STEP = 25
+BIN_STEP_COST = 2
+
+INITIAL_REPLICATIONS = 5
+REPLICATIONS_PER_ROUND = 20
+TARGET_PCS = 0.95
+INDIFFERENCE = 2.0  # Total production differences below this are not worth telling apart
+MAX_CANDIDATES = 64  # Past this many investments, only the stations that screen best are enumerated
+
+class Candidate(object):
+    def __init__(self, steps, bin_steps, error_rates, base_params):
+        self.steps = steps
+        self.bin_steps = bin_steps
+        self.cost = sum(steps) * ERROR_STEP_COST + bin_steps * BIN_STEP_COST
+        bin_size = base_params.get("bin_size", DEFAULT_PARAMS["bin_size"]) + bin_steps * BIN_STEP
+        self.params = dict(base_params, num_stations=len(error_rates), bin_size=bin_size,
+                           error_rates=[rate * ERROR_STEP_FACTOR ** step for rate, step in zip(error_rates, steps)])
+        self.samples = []
+
+    def mean(self):
+        return float(np.mean(self.samples))
+
+    def variance(self):
+        return float(np.var(self.samples, ddof=1)) if len(self.samples) > 1 else 0.0
+
+    def describe(self):
+        parts = [f"Station {i + 1} error x{ERROR_STEP_FACTOR ** step:g}" for i, step in enumerate(self.steps) if step]
+        if self.bin_steps:
+            parts.append(f"bins +{self.bin_steps * BIN_STEP}")
+        return ", ".join(parts) or "no investment"
+
+def spends(num_stations, budget):
+    # (bin steps, error steps) of every investment that leaves no affordable step unspent:
+    # cutting an error rate or enlarging the bins never lowers throughput, so smaller spends
+    # are dominated
+    cheapest = min(ERROR_STEP_COST, BIN_STEP_COST) if num_stations else BIN_STEP_COST
+    for bin_steps in range(budget // BIN_STEP_COST + 1):
+        remaining = budget - bin_steps * BIN_STEP_COST
+        error_steps = remaining // ERROR_STEP_COST if num_stations else 0
+        if remaining - error_steps * ERROR_STEP_COST < cheapest:
+            yield bin_steps, error_steps
+
+def candidate_count(num_stations, budget):
+    return sum(math.comb(num_stations + error_steps - 1, error_steps) if num_stations else 1
+               for _, error_steps in spends(num_stations, budget))
+
+def investment_candidates(error_rates, budget, base_params=None, stations=None):
+    # stations limits the error rate steps to those station indexes, by default every station that fails
+    base_params = base_params or {}
+    if stations is None:
+        stations = [i for i, rate in enumerate(error_rates) if rate > 0]
+    candidates = []
+    for bin_steps, error_steps in spends(len(stations), budget):
+        for chosen in itertools.combinations_with_replacement(stations, error_steps):
+            steps = [chosen.count(i) for i in range(len(error_rates))]
+            candidates.append(Candidate(steps, bin_steps, error_rates, base_params))
+    return candidates
+
+def screen_stations(error_rates, base_params, cpu, store=None, processes=None, replications=INITIAL_REPLICATIONS):
+    # Single-step moves: halve one station's error rate and nothing else. Returns the station
+    # indexes by throughput gained, best first. Stations the budget did not reach are left out
+    moves = [Candidate([int(i == j) for j in range(len(error_rates))], 0, error_rates, base_params)
+             for i, rate in enumerate(error_rates) if rate > 0]
+    jobs = [("line", move.params, seed) for move in moves for seed in range(replications)]
+    for k, result in enumerate(cpu.run(jobs, store, processes)):
+        moves[k // replications].samples.append(sum(result["production"]))
+    ranked = sorted((move for move in moves if move.samples), key=lambda move: -move.mean())
+    return [move.steps.index(1) for move in ranked]
+
+def shortlist(ranked, budget, max_candidates=MAX_CANDIDATES):
+    # The longest prefix of the ranked stations whose investments stay within max_candidates
+    stations = []
+    for station in ranked:
+        if stations and candidate_count(len(stations) + 1, budget) > max_candidates:
+            break
+        stations.append(station)
+    return stations
+
+def ocba(means, variances, counts, increment):
+    # Optimal computing budget allocation (Chen et al.) for picking the largest mean:
+    # N_i ~ (sigma_i / delta_i)^2 for the others, N_b = sigma_b * sqrt(sum N_i^2 / sigma_i^2)
+    best = int(np.argmax(means))
+    others = np.arange(len(means)) != best
+    variances = np.maximum(variances, 1e-9)
+    delta = np.maximum(means[best] - means, 1e-9)
+    ratios = np.zeros(len(means))
+    ratios[others] = variances[others] / delta[others] ** 2
+    ratios[best] = math.sqrt(variances[best] * np.sum(ratios[others] ** 2 / variances[others]))
+    target = (counts.sum() + increment) * ratios / ratios.sum()
+    wanted = np.maximum(target - counts, 0)
+    if wanted.sum() == 0:
+        wanted[best] = 1
+    # Hand out the increment in proportion to the shortfall, largest remainders first
+    share = wanted * increment / wanted.sum()
+    allocation = np.floor(share).astype(int)
+    for i in np.argsort(allocation - share)[:increment - allocation.sum()]:
+        allocation[i] += 1
+    return allocation
+
+def probability_correct_selection(candidates, indifference=INDIFFERENCE):
+    # Bonferroni lower bound on P(the top mean is within the indifference zone of the best).
+    # Every candidate runs seeds 0, 1, 2, ... so each comparison uses the paired differences
+    # over their common seeds, which common random numbers make far less noisy
+    best = max(candidates, key=lambda candidate: candidate.mean())
+    missed = 0.0
+    for candidate in candidates:
+        if candidate is not best:
+            common = min(len(best.samples), len(candidate.samples))
+            if common < 2:
+                missed += 0.5  # Nothing to tell them apart yet
+                continue
+            differences = np.subtract(best.samples[:common], candidate.samples[:common])
+            se = float(np.std(differences, ddof=1)) / math.sqrt(common)
+            gap = max(best.mean() - candidate.mean(), indifference)
+            missed += 0.5 * math.erfc(gap / max(se, 1e-12) / math.sqrt(2))
+    return max(0.0, 1.0 - missed)
+
+def optimize(error_rates, budget, base_params=None, cpu_budget=60.0, store=None, processes=None,
+             target_pcs=TARGET_PCS, indifference=INDIFFERENCE, initial=INITIAL_REPLICATIONS,
+             increment=REPLICATIONS_PER_ROUND, max_candidates=MAX_CANDIDATES):
+    # Sequential ranking and selection on total production. Stops when the best candidate
+    # is identified with probability target_pcs or the CPU budget is spent. Every batch of
+    # replications is checked against the budget first, the screening included; replications
+    # already in the store cost nothing
+    base_params = base_params or {}
+    cpu = CpuBudget(cpu_budget, increment)
+    stations = [i for i, rate in enumerate(error_rates) if rate > 0]
+    screened = candidate_count(len(stations), budget) > max_candidates
+    if screened:
+        stations = shortlist(screen_stations(error_rates, base_params, cpu, store, processes, max(initial, 2)),
+                             budget, max_candidates)
+    candidates = investment_candidates(error_rates, budget, base_params, stations)
+    allocation = np.full(len(candidates), max(initial, 2))
+    rounds = 0
+    while True:
+        jobs = []
+        owners = []
+        for candidate, extra in zip(candidates, allocation):
+            for seed in range(len(candidate.samples), len(candidate.samples) + extra):
+                jobs.append(("line", candidate.params, seed))
+                owners.append(candidate)
+        results = cpu.run(jobs, store, processes)
+        if results:
+            rounds += 1
+        for candidate, result in zip(owners, results):
+            candidate.samples.append(sum(result["production"]))
+
+        evaluated = [candidate for candidate in candidates if candidate.samples]
+        pcs = probability_correct_selection(evaluated, indifference) if evaluated else 0.0
+        if len(candidates) < 2 or pcs >= target_pcs or len(results) < len(jobs) or cpu.exhausted():
+            break
+        means = np.array([candidate.mean() for candidate in candidates])
+        variances = np.array([candidate.variance() for candidate in candidates])
+        counts = np.array([len(candidate.samples) for candidate in candidates])
+        allocation = ocba(means, variances, counts, increment)
+
+    return {
+        "candidates": sorted(evaluated, key=lambda candidate: -candidate.mean()),
+        "unevaluated": len(candidates) - len(evaluated),
+        "stations": len(stations),
+        "screened": screened,
+        "pcs": pcs,
+        "indifference": indifference,
+        "cpu_seconds": cpu.cpu_seconds,
+        "replications": sum(len(candidate.samples) for candidate in candidates),
+        "rounds": rounds,
+    }
+
+def print_optimization_report(result, top=5):
+    rows = []
+    for rank, candidate in enumerate(result["candidates"][:top], 1):
+        half_width = 1.96 * math.sqrt(candidate.variance() / len(candidate.samples))
+        rows.append([rank, candidate.describe(), candidate.cost, f"{candidate.mean():.1f} ± {half_width:.1f}",
+                     len(candidate.samples)])
+    print(tabulate(rows, headers=["Rank", "Investment", "Cost", "Total Production", "Replications"]))
+    print(f"\nP(rank 1 is best within {result['indifference']:g} units) >= {result['pcs']:.3f}")
+    print(f"{len(result['candidates'])} candidates, {result['replications']} replications in {result['rounds']} "
+          f"rounds, {result['cpu_seconds']:.1f} CPU seconds")
+    if result["screened"]:
+        print(f"Too many investments to try them all: enumerated the {result['stations']} stations whose "
+              f"single-step moves screened best")
+    if result["unevaluated"]:
+        print(f"{result['unevaluated']} candidates were not reached within the CPU budget")
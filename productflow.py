@@ -0,0 +1,103 @@
+import numpy as np
+
+# One row per product visit to a station, kept in a single preallocated record
+# array instead of one Python object per product
+VISIT_DTYPE = np.dtype([
+    ("product", np.int64),
+    ("station", np.int32),
+    ("entry", np.float64),
+    ("exit", np.float64),
+])
+
+class FlowTracker(object):
+    # Products are counted from their arrival until they leave, so anything still in process at
+    # the horizon is work in progress. note says what a "product" is when it is not a real one
+    def __init__(self, capacity=1 << 16, note=None):
+        self.visits = np.zeros(capacity, dtype=VISIT_DTYPE)
+        self.size = 0
+        self.products = 0
+        self.arrivals = np.full(capacity, np.nan)
+        self.departures = np.full(capacity, np.nan)
+        self.note = note
+
+    def new_product(self, arrival):
+        product = self.products
+        if product == len(self.arrivals):
+            self.arrivals = np.append(self.arrivals, np.full(product, np.nan))
+            self.departures = np.append(self.departures, np.full(product, np.nan))
+        self.arrivals[product] = arrival
+        self.products += 1
+        return product
+
+    def finish(self, product, departure):
+        self.departures[product] = departure
+
+    def record(self, product, station, entry, exit):
+        if self.size == len(self.visits):
+            visits = np.zeros(2 * len(self.visits), dtype=VISIT_DTYPE)
+            visits[:self.size] = self.visits
+            self.visits = visits
+        self.visits[self.size] = (product, station, entry, exit)
+        self.size += 1
+
+    def view(self):
+        return self.visits[:self.size]
+
+    def cycle_times(self):
+        # Arrival and cycle time of every product that has left
+        arrivals = self.arrivals[:self.products]
+        departures = self.departures[:self.products]
+        done = ~np.isnan(departures)
+        return arrivals[done], departures[done] - arrivals[done]
+
+    def wip(self):
+        # Step function of products in the system: +1 at each arrival, -1 at each departure
+        arrivals = self.arrivals[:self.products]
+        departures = self.departures[:self.products]
+        departures = departures[~np.isnan(departures)]
+        times = np.concatenate([arrivals, departures])
+        steps = np.concatenate([np.ones(len(arrivals)), -np.ones(len(departures))])
+        order = np.argsort(times, kind="stable")
+        return times[order], np.cumsum(steps[order])
+
+    def station_wip(self, station):
+        visits = self.view()
+        visits = visits[visits["station"] == station]
+        times = np.concatenate([visits["entry"], visits["exit"]])
+        steps = np.concatenate([np.ones(len(visits)), -np.ones(len(visits))])
+        order = np.argsort(times, kind="stable")
+        return times[order], np.cumsum(steps[order])
+
+    def report(self, horizon):
+        if self.products == 0:
+            return {"products": 0}
+        arrivals = self.arrivals[:self.products]
+        departures = self.departures[:self.products]
+        _, cycle = self.cycle_times()
+        times, wip = self.wip()
+        # Little's law L = lambda * W from independent measurements: L is the time-average of
+        # everything in the system, open products included, and lambda the arrival rate
+        in_system = np.where(np.isnan(departures), horizon, departures).clip(max=horizon) - arrivals
+        average_wip = float(in_system.sum() / horizon)
+        arrival_rate = self.products / horizon
+        report = {
+            "products": self.products,
+            "completed": len(cycle),
+            "in_process": self.products - len(cycle),
+            "average_wip": average_wip,
+            "max_wip": float(wip.max()),
+            "arrival_rate": arrival_rate,
+            "throughput": len(cycle) / horizon,
+        }
+        if len(cycle):
+            mean_cycle = float(cycle.mean())
+            report.update({
+                "mean_cycle_time": mean_cycle,
+                "p50_cycle_time": float(np.percentile(cycle, 50)),
+                "p90_cycle_time": float(np.percentile(cycle, 90)),
+                "p99_cycle_time": float(np.percentile(cycle, 99)),
+                "max_cycle_time": float(cycle.max()),
+                "littles_law_wip": arrival_rate * mean_cycle,
+                "littles_law_error": abs(average_wip - arrival_rate * mean_cycle) / max(average_wip, 1e-12),
+            })
+        return report
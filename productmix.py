@@ -0,0 +1,239 @@
+import itertools
+import random
+import time
+
+import numpy as np
+import simpy
+from tabulate import tabulate
+
+from maintenance import MaintenanceCrew, failures
+from manufactoringsim import DEFAULT_PARAMS, StationRegistry, WorkStation, stream_seed
+from refillsystem import RefillSystem
+from statetracker import StateTracker
+
+class ProductType(object):
+    def __init__(self, name, routing, work_time_mean=4, work_time_sd=1, rejection_probability=0.05,
+                 priority=0, weight=1):
+        self.name = name
+        self.routing = list(routing)  # Station indexes in visiting order
+        self.work_time_mean = work_time_mean
+        self.work_time_sd = work_time_sd
+        self.rejection_probability = rejection_probability
+        self.priority = priority  # Lower values are dispatched first
+        self.weight = weight  # Share of arrivals
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+class ProductKPIs(object):
+    def __init__(self, product_types):
+        count = len(product_types)
+        self.names = [product_type.name for product_type in product_types]
+        self.released = np.zeros(count, dtype=np.int64)
+        self.completed = np.zeros(count, dtype=np.int64)
+        self.rejected = np.zeros(count, dtype=np.int64)
+        self.cycle_time = np.zeros(count)
+        self.work_time = np.zeros(count)
+
+    def rows(self):
+        completed = np.maximum(self.completed, 1)
+        return [[name, released, done, rejected, cycle, work]
+                for name, released, done, rejected, cycle, work in zip(
+                    self.names, self.released, self.completed, self.rejected,
+                    self.cycle_time / completed, self.work_time / completed)]
+
+class MixedWorkStation(WorkStation):
+    __slots__ = ("line", "queue")
+
+    def __init__(self, id, env, line, refill, error_rate, registry, crew, params, tracker, calendar, rng, states=None):
+        self.line = line
+        # Jobs are (priority, sequence, product type, product, routing step, release time) tuples,
+        # so the store's heap dispatches by priority and then first come first served
+        self.queue = simpy.PriorityStore(env)
+        super().__init__(id, env, refill, error_rate, None, registry, line.exporter, crew, params, tracker,
+                         calendar, rng, states)
+
+    def run(self):
+        types = self.line.product_types
+        kpis = self.line.kpis
+        if self.states is not None:
+            self.state_slots[self.env.active_process] = self.states.add(self.id)
+        while True:
+            try:
+                self.enter("idle")  # No job waiting is lack of demand, not a loss
+                _, _, kind, product, step, released = yield self.queue.get()
+                product_type = types[kind]
+                if self.calendar is not None:
+                    yield from self.wait_for_shift()
+                if self.broken:
+                    yield from self.fix_breakdown()
+                entry = self.env.now
+                duration = max(self.rng.normalvariate(product_type.work_time_mean, product_type.work_time_sd), 0)
+                yield from self.work(duration)
+                self.occupancy += duration
+                kpis.work_time[kind] += duration
+                yield from self.ensure_material()
+                yield from self.check_failure()
+                while self.material <= 0:
+                    # Never take an item out of an empty bin, wait for the delivery instead
+                    yield from self.ensure_material()
+                self.material -= 1
+                if self.tracker is not None:
+                    self.tracker.record(product, self.id, entry, self.env.now)
+                if self.rng.random() <= product_type.rejection_probability:
+                    self.log("rejected", f"Work Station {self.id} {product_type.name} {product} REJECTED")
+                    self.rejected += 1
+                    kpis.rejected[kind] += 1
+                    if self.tracker is not None:
+                        self.tracker.finish(product, self.env.now)
+                    continue
+                self.production += 1
+                self.log("produced", f"Work Station {self.id} produced {product_type.name} {product}")
+                if step + 1 < len(product_type.routing):
+                    self.line.dispatch(kind, product, step + 1, released)
+                else:
+                    kpis.completed[kind] += 1
+                    kpis.cycle_time[kind] += self.env.now - released
+                    if self.tracker is not None:
+                        self.tracker.finish(product, self.env.now)
+            except simpy.Interrupt:
+                self.log("interrupted", f"Work Station {self.id} is interrupted for repair.")
+                yield from self.fix_breakdown()
+
+class MixedLine(object):
+    def __init__(self, env, num_stations, error_rates, product_types, arrival_rate, refill_policy="fifo",
+                 crew_size=None, params=None, tracker=None, exporter=None, calendar=None, seed=None):
+        self.env = env
+        self.params = dict(DEFAULT_PARAMS, **(params or {}))
+        self.product_types = product_types
+        self.arrival_rate = arrival_rate
+        self.kpis = ProductKPIs(product_types)
+        self.tracker = tracker
+        self.exporter = exporter
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.rng = random.Random(stream_seed(seed, "arrivals"))
+        self._seq = itertools.count()
+        self._products = itertools.count()
+        self.states = StateTracker(env)
+        refill = RefillSystem(env, capacity=self.params["refill_capacity"], refill_time=self.params["refill_time"],
+                              policy=refill_policy, states=self.states)
+        crew = MaintenanceCrew(env, crew_size) if crew_size else None
+        registry = StationRegistry(num_stations)
+        self.stations = []
+        for i in range(num_stations):
+            station = MixedWorkStation(i + 1, env, self, refill, error_rates[i], registry, crew, self.params, tracker,
+                                       calendar, random.Random(stream_seed(seed, "station", i + 1)), self.states)
+            if crew is not None and error_rates[i] > 0:
+                env.process(failures(env, station, self.params["work_time_mean"] / error_rates[i],
+                                     random.Random(stream_seed(seed, "failures", i + 1))))
+            self.stations.append(station)
+        weights = np.array([product_type.weight for product_type in product_types], dtype=float)
+        self._cumulative_weights = list(np.cumsum(weights / weights.sum()))
+        env.process(self.arrivals())
+
+    def ideal_cycle_times(self):
+        # Nominal work time per station, averaged over the product types routed through it
+        weights = np.zeros(len(self.stations))
+        work = np.zeros(len(self.stations))
+        for product_type in self.product_types:
+            for station in product_type.routing:
+                weights[station] += product_type.weight
+                work[station] += product_type.weight * product_type.work_time_mean
+        return np.where(weights > 0, work / np.maximum(weights, 1e-12), self.params["work_time_mean"])
+
+    def dispatch(self, kind, product, step, released):
+        station = self.stations[self.product_types[kind].routing[step]]
+        station.queue.put((self.product_types[kind].priority, next(self._seq), kind, product, step, released))
+
+    def arrivals(self):
+        while True:
+            yield self.env.timeout(self.rng.expovariate(self.arrival_rate))
+            kind = min(np.searchsorted(self._cumulative_weights, self.rng.random()), len(self.product_types) - 1)
+            product = self.tracker.new_product(self.env.now) if self.tracker is not None else next(self._products)
+            self.kpis.released[kind] += 1
+            self.dispatch(kind, product, 0, self.env.now)
+
+def stable_arrival_rate(product_types, error_rates, params=None, load=0.8):
+    # Arrival rate that loads the busiest station to the given utilization
+    params = dict(DEFAULT_PARAMS, **(params or {}))
+    weights = np.array([product_type.weight for product_type in product_types], dtype=float)
+    weights /= weights.sum()
+    station_work = np.zeros(len(error_rates))
+    for weight, product_type in zip(weights, product_types):
+        for station in product_type.routing:
+            station_work[station] += weight * (product_type.work_time_mean + error_rates[station] * params["repair_mean"])
+    return load / station_work.max()
+
+def random_mix(num_types, num_stations, seed=0, min_steps=3, max_steps=10):
+    rng = random.Random(seed)
+    product_types = []
+    for i in range(num_types):
+        steps = rng.randint(min_steps, min(max_steps, num_stations))
+        product_types.append(ProductType(
+            f"Product {i + 1}",
+            sorted(rng.sample(range(num_stations), steps)),
+            work_time_mean=rng.uniform(2, 6),
+            work_time_sd=rng.uniform(0.2, 1.5),
+            rejection_probability=rng.uniform(0.01, 0.08),
+            priority=rng.randint(0, 3),
+            weight=rng.uniform(0.5, 2),
+        ))
+    return product_types
+
+def run_mixed_simulation(env, num_stations, error_rates, product_types, num_runs, arrival_rate=None, **kwargs):
+    if arrival_rate is None:
+        arrival_rate = stable_arrival_rate(product_types, error_rates, kwargs.get("params"))
+    line = MixedLine(env, num_stations, error_rates, product_types, arrival_rate, **kwargs)
+    env.run(until=num_runs)
+    line.stations[0].registry.sync(line.stations)
+    return line
+
+def print_product_report(line):
+    print("\nProduct Data:")
+    print(tabulate(line.kpis.rows(), headers=["Product", "Released", "Completed", "Rejected",
+                                              "Average Cycle Time", "Average Work Time"]))
+
+def plot_product_results(line):
+    import matplotlib.pyplot as plt
+
+    names = line.kpis.names
+    positions = np.arange(len(names))
+    bar_width = 0.35
+    plt.figure(figsize=(10, 6))
+    plt.bar(positions, line.kpis.completed, color='skyblue', width=bar_width, edgecolor='grey', label='Completed')
+    plt.bar(positions + bar_width, line.kpis.rejected, color='salmon', width=bar_width, edgecolor='grey',
+            label='Rejected')
+    plt.xlabel('Product', fontweight='bold')
+    plt.xticks(positions + bar_width / 2, names, rotation=45, ha='right')
+    plt.legend()
+    plt.title('Completed and Rejected per Product')
+    plt.tight_layout()
+    plt.show()
+
+def bench_mix(num_types=50, num_stations=100, num_runs=2000, seed=0):
+    import manufactoringsim
+
+    verbose, manufactoringsim.VERBOSE = manufactoringsim.VERBOSE, False
+    try:
+        rng = random.Random(seed)
+        product_types = random_mix(num_types, num_stations, seed)
+        error_rates = [rng.uniform(0.02, 0.2) for _ in range(num_stations)]
+        env = simpy.Environment()
+        start = time.perf_counter()
+        line = run_mixed_simulation(env, num_stations, error_rates, product_types, num_runs, seed=seed)
+        elapsed = time.perf_counter() - start
+    finally:
+        manufactoringsim.VERBOSE = verbose
+    visits = int(line.stations[0].registry.view("production").sum() + line.stations[0].registry.view("rejected").sum())
+    return {
+        "product_types": num_types,
+        "stations": num_stations,
+        "horizon": num_runs,
+        "released": int(line.kpis.released.sum()),
+        "completed": int(line.kpis.completed.sum()),
+        "station_visits": visits,
+        "seconds": elapsed,
+        "visits_per_second": visits / elapsed,
+    }
@@ -0,0 +1,110 @@
+import heapq
+import itertools
+
+REFILL_POLICIES = ("fifo", "bottleneck", "predictive", "batched")
+
+class RefillSystem(object):
+    def __init__(self, env, capacity=3, refill_time=1.5, policy="fifo",
+                 batch_size=3, batch_extra_time=0.5, predictive_threshold=3, states=None):
+        if policy not in REFILL_POLICIES:
+            raise ValueError(f"Unknown refill policy {policy!r}, expected one of {REFILL_POLICIES}")
+        self.env = env
+        self.capacity = capacity
+        self.refill_time = refill_time
+        self.policy = policy
+        self.batch_size = batch_size
+        self.batch_extra_time = batch_extra_time
+        # Stations order a new bin once they are down to this many items
+        self.predictive_threshold = predictive_threshold if policy == "predictive" else None
+        self.queue = []
+        self.busy = 0
+        self._seq = itertools.count()
+        # Set to a dict to record every station's [request time, delivery time] pairs
+        self.trace = None
+        # Servers are interchangeable, server k is refilling while more than k are busy
+        self.states = states
+        self.state_slots = [states.add("Refill") for _ in range(capacity)] if states is not None else None
+
+        # Running statistics, updated in O(1) per request / delivery
+        self.requests = 0
+        self.deliveries = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.max_queue = 0
+        self._queue_area = 0.0
+        self._busy_area = 0.0
+        self._start = env.now
+        self._last = env.now
+
+    def _advance(self):
+        now = self.env.now
+        elapsed = now - self._last
+        self._queue_area += elapsed * len(self.queue)
+        self._busy_area += elapsed * self.busy
+        self._last = now
+
+    def _priority(self, station):
+        if self.policy == "bottleneck":
+            return -station.error_rate  # The most failure-prone station is the line's bottleneck
+        return 0
+
+    def request(self, station):
+        self._advance()
+        event = self.env.event()
+        heapq.heappush(self.queue, (self._priority(station), next(self._seq), self.env.now, event))
+        self.requests += 1
+        if self.trace is not None:
+            self._record(station, event)
+        self._dispatch()
+        self.max_queue = max(self.max_queue, len(self.queue))
+        return event
+
+    def _record(self, station, event):
+        record = [self.env.now, None]  # Delivery stays None while the request is outstanding
+        self.trace.setdefault(station.id, []).append(record)
+
+        def delivered(event):
+            record[1] = self.env.now
+
+        event.callbacks.append(delivered)
+
+    def _dispatch(self):
+        while self.busy < self.capacity and self.queue:
+            batch = [heapq.heappop(self.queue)]
+            if self.policy == "batched":
+                while self.queue and len(batch) < self.batch_size:
+                    batch.append(heapq.heappop(self.queue))
+            for _, _, requested, _ in batch:
+                wait = self.env.now - requested
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+            if self.states is not None:
+                self.states.set(self.state_slots[self.busy], "refilling")
+            self.busy += 1
+            self.env.process(self._deliver(batch))
+
+    def _deliver(self, batch):
+        duration = self.refill_time + self.batch_extra_time * (len(batch) - 1)
+        yield self.env.timeout(duration)
+        self._advance()
+        self.busy -= 1
+        if self.states is not None:
+            self.states.set(self.state_slots[self.busy], "idle")
+        self.deliveries += 1
+        for _, _, _, event in batch:
+            event.succeed(duration)
+        self._dispatch()
+
+    def stats(self):
+        self._advance()
+        elapsed = (self.env.now - self._start) or 1
+        return {
+            "policy": self.policy,
+            "requests": self.requests,
+            "deliveries": self.deliveries,
+            "mean_wait": self.total_wait / self.requests if self.requests else 0,
+            "max_wait": self.max_wait,
+            "mean_queue_length": self._queue_area / elapsed,
+            "max_queue_length": self.max_queue,
+            "utilization": self._busy_area / (self.capacity * elapsed),
+        }
@@ -0,0 +1,224 @@
+import contextlib
+import hashlib
+import importlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+
+import simpy
+
+import manufactoringsim
+
+DATA_VISUALIZATION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "DataVisualization")
+
+@contextlib.contextmanager
+def quiet():
+    verbose, manufactoringsim.VERBOSE = manufactoringsim.VERBOSE, False
+    try:
+        yield
+    finally:
+        manufactoringsim.VERBOSE = verbose
+
+LINE_DEFAULTS = {
+    "num_stations": 6,
+    "error_rates": [0.20, 0.10, 0.15, 0.05, 0.07, 0.10],
+    "num_runs": 500,
+    "refill_policy": "fifo",
+    "crew_size": None,
+}
+
+# The DataVisualization charts a facility scenario can run, columnChart.py by default
+FACILITY_CHARTS = ["columnChart", "GcolumnChart", "columnChartDelay", "columnChartFaulty", "columnpermachinefaulty",
+                   "connectedScatter", "paretoChart", "pieChart", "totalpropdmachine"]
+DEFAULT_CHART = "columnChart"
+# Chart module constants a facility scenario can set, by their lower case names, as far as the
+# chart defines them. NUM_WORKSTATIONS follows the length of FAILURE_PROBABILITIES
+FACILITY_CONSTANTS = ["NUM_BINS", "BIN_CAPACITY", "PRODUCTION_TIME", "FAILURE_PROBABILITIES", "REJECTION_PROBABILITY",
+                      "ACCIDENT_PROBABILITY", "FIXING_TIME_MEAN", "WORK_TIME_MEAN"]
+
+def chart_module(chart):
+    if chart not in FACILITY_CHARTS:
+        raise ValueError(f"Unknown chart {chart!r}, expected one of {', '.join(FACILITY_CHARTS)}")
+    if DATA_VISUALIZATION_DIR not in sys.path:
+        sys.path.insert(0, DATA_VISUALIZATION_DIR)
+    return importlib.import_module(chart)
+
+def facility_defaults(chart=DEFAULT_CHART):
+    module = chart_module(chart)
+    return {name.lower(): getattr(module, name) for name in FACILITY_CONSTANTS if hasattr(module, name)}
+
+def resolve_params(model, params):
+    # Every parameter the run depends on, defaults included
+    if model == "line":
+        return dict(LINE_DEFAULTS, **dict(manufactoringsim.DEFAULT_PARAMS, **params))
+    chart = params.get("chart", DEFAULT_CHART)
+    return dict(facility_defaults(chart), **dict(params, chart=chart))
+
+def check_params(model, params):
+    # A misspelled key would otherwise run the default scenario under a new name
+    if model not in MODELS:
+        raise ValueError(f"Unknown model {model!r}, expected one of {sorted(MODELS)}")
+    known = set(resolve_params(model, {"chart": params["chart"]} if model == "facility" and "chart" in params else {}))
+    unknown = sorted(set(params) - known)
+    if unknown:
+        raise ValueError(f"Unknown {model} parameters {', '.join(unknown)}, expected some of {', '.join(sorted(known))}")
+
+def run_line(params, seed):
+    # Scenario keys besides the run_simulation() arguments are model parameter overrides
+    check_params("line", params)
+    params = dict(params)
+    num_stations = params.pop("num_stations", LINE_DEFAULTS["num_stations"])
+    error_rates = params.pop("error_rates", LINE_DEFAULTS["error_rates"])
+    num_runs = params.pop("num_runs", LINE_DEFAULTS["num_runs"])
+    refill_policy = params.pop("refill_policy", LINE_DEFAULTS["refill_policy"])
+    crew_size = params.pop("crew_size", LINE_DEFAULTS["crew_size"])
+    with quiet():
+        stations = manufactoringsim.run_simulation(simpy.Environment(), num_stations, error_rates, num_runs,
+                                                   refill_policy=refill_policy, crew_size=crew_size,
+                                                   params=params, seed=seed)
+    return line_result(stations)
+
+def line_result(stations):
+    registry = stations[0].registry
+    result = {name: registry.view(name).tolist() for name, _ in manufactoringsim.STATION_FIELDS}
+    result["refill"] = stations[0].refill.stats()
+    return result
+
+def run_facility(params, seed):
+    # The model of a DataVisualization chart, without its charts. The scenario overrides the
+    # chart's module constants for the length of the run
+    check_params("facility", params)
+    params = dict(params)
+    chart = chart_module(params.pop("chart", DEFAULT_CHART))
+    saved = {name: getattr(chart, name) for name in FACILITY_CONSTANTS + ["NUM_WORKSTATIONS"] if hasattr(chart, name)}
+    try:
+        for name, value in params.items():
+            setattr(chart, name.upper(), value)
+        if hasattr(chart, "FAILURE_PROBABILITIES"):
+            chart.NUM_WORKSTATIONS = len(chart.FAILURE_PROBABILITIES)
+        _, result = chart.run(seed)
+    finally:
+        for name, value in saved.items():
+            setattr(chart, name, value)
+    return result
+
+MODELS = {
+    "line": run_line,
+    "facility": run_facility,
+}
+
+def job_id(model, params, seed):
+    # The same scenario and seed always maps to the same job, so resubmitting is a no-op
+    key = json.dumps([model, params, seed], sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def run_job(job):
+    model, params, seed = job
+    start = time.perf_counter()
+    result = MODELS[model](params, seed)
+    return job_id(model, params, seed), result, time.perf_counter() - start
+
+class ResultStore(object):
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS results (
+            job_id TEXT PRIMARY KEY, model TEXT, params TEXT, seed INTEGER,
+            result TEXT, worker TEXT, elapsed REAL, finished_at REAL, manifest TEXT)""")
+        self.db.commit()
+
+    def get(self, model, params, seed):
+        row = self.db.execute("SELECT result FROM results WHERE job_id = ?",
+                              (job_id(model, params, seed),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, model, params, seed, result, worker="local", elapsed=0.0):
+        from manifest import build_manifest
+
+        manifest = build_manifest(model, params, seed, result)
+        self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (job_id(model, params, seed), model, json.dumps(params, sort_keys=True), seed,
+                         json.dumps(result), worker, elapsed, time.time(), json.dumps(manifest)))
+        self.db.commit()
+
+    def manifest(self, key):
+        row = self.db.execute("SELECT manifest FROM results WHERE job_id = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def load(self, model=None):
+        query = "SELECT model, params, seed, result FROM results"
+        rows = self.db.execute(query + " WHERE model = ?", (model,)) if model else self.db.execute(query)
+        return [(model, json.loads(params), seed, json.loads(result)) for model, params, seed, result in rows]
+
+    def close(self):
+        self.db.close()
+
+def run_jobs(jobs, store=None, processes=None):
+    # Reuse cached replications, run the missing ones in parallel. Returns the results
+    # in job order, the CPU seconds spent on the ones that had to run and how many did
+    for model, params, _ in jobs:
+        check_params(model, params)
+    results = [None] * len(jobs)
+    missing = []
+    for index, (model, params, seed) in enumerate(jobs):
+        cached = store.get(model, params, seed) if store is not None else None
+        if cached is None:
+            missing.append(index)
+        else:
+            results[index] = cached
+    cpu_seconds = 0.0
+    if missing:
+        pending = [jobs[index] for index in missing]
+        if processes == 1 or len(pending) == 1:
+            outputs = [run_job(job) for job in pending]
+        else:
+            with multiprocessing.Pool(processes) as pool:
+                outputs = pool.map(run_job, pending)
+        for index, (_, result, elapsed) in zip(missing, outputs):
+            results[index] = result
+            cpu_seconds += elapsed
+            if store is not None:
+                model, params, seed = jobs[index]
+                store.put(model, params, seed, result, elapsed=elapsed)
+    return results, cpu_seconds, len(missing)
+
+class CpuBudget(object):
+    # Runs replications in batches while the average cost so far says the next batch still
+    # fits. Before anything has run, a single pilot replication prices the first batch
+    def __init__(self, cpu_budget, batch=20):
+        self.cpu_budget = cpu_budget
+        self.batch = batch
+        self.cpu_seconds = 0.0
+        self.runs = 0  # Replications that actually ran, cached ones cost nothing and are not counted
+
+    def fits(self, count):
+        if self.runs == 0:
+            return self.cpu_budget > 0
+        return self.cpu_seconds + self.estimate(count) <= self.cpu_budget
+
+    def estimate(self, count):
+        # CPU seconds count more replications should take, judging by the ones run so far
+        return count * self.cpu_seconds / self.runs if self.runs else 0.0
+
+    def exhausted(self):
+        return not self.fits(1)
+
+    def run(self, jobs, store=None, processes=None):
+        # Results of the jobs that fit, in job order. Fewer than len(jobs) means the budget ran out
+        results = []
+        while len(results) < len(jobs):
+            batch = jobs[len(results):len(results) + (self.batch if self.runs else 1)]
+            if not self.fits(len(batch)):
+                break
+            outputs, cpu_seconds, ran = run_jobs(batch, store, processes)
+            self.cpu_seconds += cpu_seconds
+            self.runs += ran
+            results += outputs
+        return results
+
+def run_replications(model, params, seeds, store=None, processes=None):
+    results, _, _ = run_jobs([(model, params, seed) for seed in seeds], store, processes)
+    return results
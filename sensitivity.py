@@ -0,0 +1,237 @@
+import numpy as np
+from tabulate import tabulate
+
+from manufactoringsim import DEFAULT_PARAMS
+from replication import CpuBudget
+
+FACTOR_SPREAD = 0.5  # Every factor ranges over +-50% of its base value
+MODEL_FACTORS = ["rejection_probability", "repair_mean", "work_time_mean", "work_time_sd", "bin_size", "refill_time"]
+MORRIS_LEVELS = 4
+BOOTSTRAP_SAMPLES = 200
+
+class Factor(object):
+    def __init__(self, name, base, station=None, integer=False):
+        self.name = name
+        self.base = base
+        self.low = base * (1 - FACTOR_SPREAD)
+        self.high = base * (1 + FACTOR_SPREAD)
+        self.station = station  # Index into error_rates, None for a model parameter
+        self.integer = integer
+
+    def value(self, unit):
+        # unit is the position in [0, 1] between low and high
+        value = self.low + unit * (self.high - self.low)
+        return int(round(value)) if self.integer else round(float(value), 6)
+
+def line_factors(error_rates, base_params=None):
+    params = dict(DEFAULT_PARAMS, **(base_params or {}))
+    factors = [Factor(f"error_rate_{i + 1}", rate, station=i) for i, rate in enumerate(error_rates)]
+    factors += [Factor(name, params[name], integer=name == "bin_size") for name in MODEL_FACTORS]
+    return factors
+
+def scenario(factors, units, base_params):
+    params = dict(base_params or {})
+    error_rates = []
+    for factor, unit in zip(factors, units):
+        if factor.station is not None:
+            error_rates.append(factor.value(unit))
+        else:
+            params[factor.name] = factor.value(unit)
+    params["num_stations"] = len(error_rates)
+    params["error_rates"] = error_rates
+    return params
+
+def evaluate(factors, points, seeds, base_params, cpu, store, processes, output):
+    # None when the CPU budget runs out before every point is simulated
+    jobs = [("line", scenario(factors, units, base_params), int(seed)) for units, seed in zip(points, seeds)]
+    results = cpu.run(jobs, store, processes)
+    if len(results) < len(jobs):
+        return None
+    return np.array([sum(result[output]) for result in results], dtype=float)
+
+def affordable(cpu, count, runs_each):
+    # Largest number of trajectories or sample rows, up to count, the budget still covers
+    while count and not cpu.fits(count * runs_each):
+        count -= 1
+    return count
+
+def tornado_points(k):
+    # The base point, then every factor at its low and high end with everything else at base
+    points = [np.full(k, 0.5)]
+    for i in range(k):
+        for unit in (0.0, 1.0):
+            point = np.full(k, 0.5)
+            point[i] = unit
+            points.append(point)
+    return points
+
+def tornado(factors, base_params, seeds, cpu, store=None, processes=None, output="production"):
+    # Same seeds throughout
+    points = tornado_points(len(factors))
+    runs = [point for point in points for _ in range(seeds)]
+    values = evaluate(factors, runs, list(range(seeds)) * len(points), base_params, cpu, store, processes, output)
+    if values is None:
+        raise ValueError("the CPU budget ran out during the tornado sweep")
+    means = values.reshape(len(points), seeds).mean(axis=1)
+    return {"base": means[0], "low": means[1::2], "high": means[2::2]}
+
+def morris(factors, base_params, trajectories, cpu, store=None, processes=None, output="production", seed=0,
+           batch=4):
+    # Elementary effects screening: random one-at-a-time trajectories on a grid. Every point of
+    # a trajectory shares one simulation seed, so the effects are not swamped by seed noise
+    rng = np.random.default_rng(seed)
+    k = len(factors)
+    delta = MORRIS_LEVELS / (2 * (MORRIS_LEVELS - 1))
+    effects = []
+    while len(effects) < trajectories:
+        count = affordable(cpu, min(batch, trajectories - len(effects)), k + 1)
+        if not count:
+            break
+        points, seeds, orders = [], [], []
+        for t in range(len(effects), len(effects) + count):
+            x = rng.integers(0, MORRIS_LEVELS // 2, k) / (MORRIS_LEVELS - 1)
+            order = rng.permutation(k)
+            points.append(x)
+            for i in order:
+                x = x.copy()
+                x[i] += delta
+                points.append(x)
+            seeds += [t] * (k + 1)
+            orders.append(order)
+        values = evaluate(factors, points, seeds, base_params, cpu, store, processes, output)
+        if values is None:
+            break
+        for j, order in enumerate(orders):
+            trajectory = values[j * (k + 1):(j + 1) * (k + 1)]
+            effect = np.zeros(k)
+            effect[order] = np.diff(trajectory) / delta
+            effects.append(effect)
+    if not effects:
+        raise ValueError("the CPU budget ran out before the first Morris trajectory")
+    effects = np.array(effects)
+    return {
+        "method": "morris",
+        "samples": len(effects),
+        "indices": {"mu_star": np.abs(effects).mean(axis=0), "mu": effects.mean(axis=0),
+                    "sigma": effects.std(axis=0, ddof=1) if len(effects) > 1 else np.zeros(k)},
+        "rank_by": "mu_star",
+    }
+
+def sobol_indices(f_a, f_b, f_ab):
+    # Saltelli (2010) first order and Jansen total effect estimators
+    variance = np.var(np.concatenate([f_a, f_b]), ddof=1)
+    first = np.mean(f_b[:, None] * (f_ab - f_a[:, None]), axis=0) / variance
+    total = 0.5 * np.mean((f_a[:, None] - f_ab) ** 2, axis=0) / variance
+    return first, total
+
+def sobol(factors, base_params, samples, cpu, store=None, processes=None, output="production", seed=0,
+          batch=8):
+    # Variance-based indices from the A, B and A_B^(i) matrices, k + 2 runs per sample row.
+    # A row and its k mixes share one simulation seed
+    rng = np.random.default_rng(seed)
+    k = len(factors)
+    a = rng.random((samples, k))
+    b = rng.random((samples, k))
+    f_a, f_b, f_ab = [], [], []
+    while len(f_a) < samples:
+        count = affordable(cpu, min(batch, samples - len(f_a)), k + 2)
+        if not count:
+            break
+        rows = range(len(f_a), len(f_a) + count)
+        points, seeds = [], []
+        for j in rows:
+            points += [a[j], b[j]]
+            for i in range(k):
+                mixed = a[j].copy()
+                mixed[i] = b[j, i]
+                points.append(mixed)
+            seeds += [j] * (k + 2)
+        values = evaluate(factors, points, seeds, base_params, cpu, store, processes, output)
+        if values is None:
+            break
+        values = values.reshape(len(rows), k + 2)
+        f_a += list(values[:, 0])
+        f_b += list(values[:, 1])
+        f_ab += list(values[:, 2:])
+    if not f_a:
+        raise ValueError("the CPU budget ran out before the first Sobol sample row")
+    f_a, f_b, f_ab = np.array(f_a), np.array(f_b), np.array(f_ab)
+    first, total = sobol_indices(f_a, f_b, f_ab)
+
+    # Bootstrap the sample rows for 95% intervals
+    resamples = rng.integers(0, len(f_a), (BOOTSTRAP_SAMPLES, len(f_a)))
+    boot = np.array([np.concatenate(sobol_indices(f_a[rows], f_b[rows], f_ab[rows])) for rows in resamples])
+    low, high = np.percentile(boot, [2.5, 97.5], axis=0)
+    return {
+        "method": "sobol",
+        "samples": len(f_a),
+        "indices": {"first_order": first, "first_order_ci": (high[:k] - low[:k]) / 2,
+                    "total": total, "total_ci": (high[k:] - low[k:]) / 2},
+        "rank_by": "total",
+    }
+
+def analyze(error_rates, method="morris", base_params=None, core_hours=0.01, samples=None, store=None,
+            processes=None, output="production", seed=0, tornado_seeds=5):
+    # The tornado runs first, the screening or Sobol batches get whatever is left of the budget.
+    # A pilot run prices both up front, a budget that cannot cover the tornado and two Morris
+    # trajectories or Sobol rows is refused before anything else runs
+    cpu = CpuBudget(core_hours * 3600)
+    base_params = dict(base_params or {})
+    factors = line_factors(error_rates, base_params)
+    k = len(factors)
+    evaluate(factors, [np.full(k, 0.5)], [0], base_params, cpu, store, processes, output)
+    needed = (2 * k + 1) * tornado_seeds + 2 * (k + 2 if method == "sobol" else k + 1)
+    if not cpu.fits(needed):
+        raise ValueError(f"{needed} runs need about {cpu.cpu_seconds + cpu.estimate(needed):.1f} CPU seconds, "
+                         f"{core_hours:g} core hours is {cpu.cpu_budget:.1f}")
+    swings = tornado(factors, base_params, tornado_seeds, cpu, store, processes, output)
+    if method == "sobol":
+        result = sobol(factors, base_params, samples or 128, cpu, store, processes, output, seed)
+    else:
+        result = morris(factors, base_params, samples or 20, cpu, store, processes, output, seed)
+    result["factors"] = factors
+    result["tornado"] = swings
+    result["output"] = output
+    result["cpu_seconds"] = cpu.cpu_seconds
+    result["core_hours"] = core_hours
+    return result
+
+def print_sensitivity_report(result):
+    indices = result["indices"]
+    order = np.argsort(-indices[result["rank_by"]])
+    swings = result["tornado"]
+    if result["method"] == "sobol":
+        headers = ["Rank", "Factor", "Range", "Total Effect", "First Order", "Low", "High"]
+        columns = lambda i: [f"{indices['total'][i]:.3f} ± {indices['total_ci'][i]:.3f}",
+                             f"{indices['first_order'][i]:.3f} ± {indices['first_order_ci'][i]:.3f}"]
+    else:
+        headers = ["Rank", "Factor", "Range", "Mu*", "Mu", "Sigma", "Low", "High"]
+        columns = lambda i: [indices["mu_star"][i], indices["mu"][i], indices["sigma"][i]]
+    rows = []
+    for rank, i in enumerate(order, 1):
+        factor = result["factors"][i]
+        rows.append([rank, factor.name, f"{factor.value(0):g} - {factor.value(1):g}"] + columns(i)
+                    + [swings["low"][i], swings["high"][i]])
+    print(f"Sensitivity of total {result['output']} ({result['method']}, {result['samples']} samples, "
+          f"base {swings['base']:.1f}):")
+    print(tabulate(rows, headers=headers, floatfmt=".2f"))
+    print(f"\n{result['cpu_seconds']:.1f} CPU seconds of a {result['core_hours'] * 3600:.0f} second budget")
+
+def plot_tornado(result):
+    import matplotlib.pyplot as plt
+
+    swings = result["tornado"]
+    base = swings["base"]
+    order = np.argsort(np.abs(swings["high"] - swings["low"]))
+    names = [result["factors"][i].name for i in order]
+    positions = np.arange(len(order))
+    plt.figure(figsize=(10, 6))
+    plt.barh(positions, swings["low"][order] - base, left=base, color='salmon', edgecolor='grey', label='Low')
+    plt.barh(positions, swings["high"][order] - base, left=base, color='skyblue', edgecolor='grey', label='High')
+    plt.axvline(base, color='black', linewidth=1)
+    plt.yticks(positions, names)
+    plt.xlabel(f"Total {result['output']}", fontweight='bold')
+    plt.title('Tornado Chart')
+    plt.legend()
+    plt.tight_layout()
+    plt.show()
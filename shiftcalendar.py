@@ -0,0 +1,94 @@
+import bisect
+
+def _merge(intervals):
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [start for start, _ in merged], [end for _, end in merged]
+
+def _unwrap(shifts, period):
+    # Shifts past the end of the period (a night shift [22, 30] in a 24 hour day) or before
+    # its start are split at the period boundary into windows within [0, period)
+    intervals = []
+    for start, end in shifts:
+        if end < start:
+            raise ValueError(f"shift [{start}, {end}] ends before it starts")
+        if end - start >= period:
+            return [(0, period)]
+        start, end = start % period, start % period + (end - start)
+        if end > period:
+            intervals += [(start, period), (0, end - period)]
+        elif end > start:
+            intervals.append((start, end))
+    if not intervals:
+        raise ValueError("every shift has zero length, the line would never open")
+    return intervals
+
+class ShiftCalendar(object):
+    # A repeating shift pattern plus one-off planned downtime windows. Windows are
+    # merged into sorted start/end lists, so every lookup is a bisect: O(log n)
+    # in the number of windows, O(1) for the repeating pattern
+    def __init__(self, period=None, shifts=None):
+        if shifts is not None and not shifts:
+            raise ValueError("an empty shift list never opens the line, leave shifts out to stay open around the clock")
+        self.period = period
+        if shifts is None:
+            shifts = [(0, period)]
+        self.shift_starts, self.shift_ends = _merge(_unwrap(shifts, period) if period else [])
+        self._pending = {}
+        self._windows = {}
+
+    @classmethod
+    def from_dict(cls, data):
+        calendar = cls(data.get("period"), data.get("shifts"))
+        for window in data.get("downtime", []):
+            calendar.add_downtime(window["start"], window["end"], window.get("station"))
+        return calendar
+
+    def add_downtime(self, start, end, station=None):
+        # station=None closes the whole line
+        self._pending.setdefault(station, []).append((start, end))
+        self._windows.pop(station, None)
+
+    def _index(self, station):
+        windows = self._windows.get(station)
+        if windows is None:
+            windows = self._windows[station] = _merge(self._pending.get(station, []))
+        return windows
+
+    def _closed_until(self, starts, ends, t):
+        # End of the window containing t, or None when t is outside every window
+        i = bisect.bisect_right(starts, t) - 1
+        if i >= 0 and t < ends[i]:
+            return ends[i]
+        return None
+
+    def _next_shift_start(self, t):
+        if self.period is None:
+            return None
+        cycle, phase = divmod(t, self.period)
+        i = bisect.bisect_right(self.shift_starts, phase) - 1
+        if i >= 0 and phase < self.shift_ends[i]:
+            return None
+        if i + 1 < len(self.shift_starts):
+            return cycle * self.period + self.shift_starts[i + 1]
+        return (cycle + 1) * self.period + self.shift_starts[0]
+
+    def next_available(self, station, t):
+        # Jump over shift gaps and downtime windows until all of them agree t is open
+        while True:
+            resume = self._next_shift_start(t)
+            for key in (None, station):
+                if key in self._pending:
+                    closed_until = self._closed_until(*self._index(key), t)
+                    if closed_until is not None:
+                        resume = max(resume or closed_until, closed_until)
+            if resume is None:
+                return t
+            t = resume
+
+    def is_available(self, station, t):
+        return self.next_available(station, t) == t
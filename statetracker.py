@@ -0,0 +1,56 @@
+import numpy as np
+
+STATES = ("busy", "idle", "blocked", "starved", "down", "refilling")
+
+class StateTracker(object):
+    # Time-weighted state accounting: every slot (a station loop, a refill server, ...)
+    # is in exactly one state, and a transition adds the time since the last one to the
+    # state being left. O(1) per transition, no history is kept
+    def __init__(self, env, states=STATES):
+        self.env = env
+        self.states = states
+        self.index = {state: i for i, state in enumerate(states)}
+        self.owners = []
+        self.current = []
+        self.since = []
+        self.durations = []
+
+    def add(self, owner, state="idle"):
+        slot = len(self.owners)
+        self.owners.append(owner)
+        self.current.append(self.index[state])
+        self.since.append(self.env.now)
+        self.durations.append([0.0] * len(self.states))
+        return slot
+
+    def set(self, slot, state):
+        now = self.env.now
+        self.durations[slot][self.current[slot]] += now - self.since[slot]
+        self.current[slot] = self.index[state]
+        self.since[slot] = now
+
+    def totals(self):
+        # Durations per owner (owners x states), the open interval of every slot included
+        owners = list(dict.fromkeys(self.owners))
+        rows = {owner: i for i, owner in enumerate(owners)}
+        totals = np.zeros((len(owners), len(self.states)))
+        now = self.env.now
+        for owner, current, since, durations in zip(self.owners, self.current, self.since, self.durations):
+            row = totals[rows[owner]]
+            row += durations
+            row[current] += now - since
+        return owners, totals
+
+    def fractions(self):
+        owners, totals = self.totals()
+        return owners, totals / np.maximum(totals.sum(axis=1, keepdims=True), 1e-12)
+
+def oee(durations, good, total, ideal_cycle_time, states=STATES):
+    # Availability x performance x quality. Idle time (closed, off shift) is not planned
+    # production time, every other non-busy state is an availability loss
+    busy = durations[..., states.index("busy")]
+    planned = durations.sum(axis=-1) - durations[..., states.index("idle")]
+    availability = busy / np.maximum(planned, 1e-12)
+    performance = ideal_cycle_time * total / np.maximum(busy, 1e-12)
+    quality = good / np.maximum(total, 1)
+    return availability, performance, quality, availability * performance * quality
@@ -0,0 +1,143 @@
+import math
+
+import numpy as np
+from tabulate import tabulate
+
+from manufactoringsim import DEFAULT_PARAMS
+
+# Above this refill utilization the queueing approximation is too rough to trust
+MAX_REFILL_UTILIZATION = 0.9
+# Relative bias of the approximation against simulation, which no horizon averages away.
+# Measured over bin sizes 5-25, 1-3 refill servers and 0.5-3 time unit refill trips: about
+# 1% with an idle refill queue, up to 3% at half load and more as the queue saturates
+MODEL_ERROR = 0.01
+MODEL_ERROR_PER_UTILIZATION = 0.1
+# The approximation models a FIFO refill queue and per item failures without a crew
+SURROGATE_POLICIES = ("fifo",)
+
+def erlang_c_wait(arrival_rate, service_time, servers):
+    # Mean wait in queue of an M/M/c system
+    load = arrival_rate * service_time
+    utilization = load / servers
+    if utilization >= 1:
+        return math.inf
+    term = 1.0
+    total = 1.0
+    for k in range(1, servers):
+        term *= load / k
+        total += term
+    last = term * load / servers / (1 - utilization)
+    probability_wait = last / (total + last)
+    return probability_wait * service_time / (servers * (1 - utilization))
+
+def estimate(error_rates, horizon, params=None):
+    params = dict(DEFAULT_PARAMS, **(params or {}))
+    error_rates = np.asarray(error_rates, dtype=float)
+    work_mean = params["work_time_mean"]
+    work_var = params["work_time_sd"] ** 2
+    repair_mean = params["repair_mean"]
+    bin_size = params["bin_size"]
+    refill_time = params["refill_time"]
+    rejection = params["rejection_probability"]
+
+    # Product drives a second run() loop on the first station, so it draws twice as fast
+    loops = np.ones(len(error_rates))
+    loops[0] = 2
+
+    # Per-item cycle: processing, a possible repair and a share of the refill trip.
+    # The refill wait and the cycle time depend on each other, a few fixed-point passes settle it.
+    refill_wait = 0.0
+    for _ in range(5):
+        refill_share = (refill_time + refill_wait) / bin_size
+        cycle = work_mean + error_rates * repair_mean + refill_share / loops
+        refill_rate = float(np.sum(loops / (bin_size * cycle)))
+        # Refill trips are deterministic, M/D/c waits are roughly half of M/M/c
+        refill_wait = 0.5 * erlang_c_wait(refill_rate, refill_time, params["refill_capacity"])
+        if math.isinf(refill_wait):
+            break
+    refill_utilization = refill_rate * refill_time / params["refill_capacity"]
+
+    repair_var = error_rates * 2 * repair_mean ** 2 - (error_rates * repair_mean) ** 2
+    cycle_var = work_var + repair_var
+    items = loops * horizon / cycle
+    # Renewal-reward central limit theorem for the number of completed cycles
+    items_var = loops * horizon * cycle_var / cycle ** 3
+
+    rejected = items * rejection
+    rejected_var = rejection ** 2 * items_var + items * rejection * (1 - rejection)
+    production = items - rejected
+    production_var = (1 - rejection) ** 2 * items_var + items * rejection * (1 - rejection)
+    downtime = items * error_rates * repair_mean
+    downtime_var = items * repair_var + (error_rates * repair_mean) ** 2 * items_var
+
+    return {
+        "production": production,
+        "production_se": np.sqrt(production_var),
+        "rejected": rejected,
+        "rejected_se": np.sqrt(rejected_var),
+        "downtime": downtime,
+        "downtime_se": np.sqrt(downtime_var),
+        "total_production": production.sum(),
+        "total_production_se": math.sqrt(production_var.sum()),
+        "total_rejected": rejected.sum(),
+        "total_rejected_se": math.sqrt(rejected_var.sum()),
+        "refill_wait": refill_wait,
+        "refill_utilization": refill_utilization,
+        "model_error": (MODEL_ERROR + MODEL_ERROR_PER_UTILIZATION * refill_utilization) * production.sum(),
+    }
+
+def needs_simulation(result, tolerance=0.05):
+    # Fall back when the 95% half-width plus the model's own bias is too wide or the refill
+    # queue is near saturation
+    if result["refill_utilization"] > MAX_REFILL_UTILIZATION:
+        return True
+    half_width = 1.96 * result["total_production_se"] + result["model_error"]
+    return half_width > tolerance * max(result["total_production"], 1)
+
+def what_if(error_rates, horizon, params=None, tolerance=0.05, refill_policy="fifo", crew_size=None, seed=None):
+    if refill_policy in SURROGATE_POLICIES and not crew_size:
+        result = estimate(error_rates, horizon, params)
+        if not needs_simulation(result, tolerance):
+            result["source"] = "surrogate"
+            return result
+
+    import simpy
+    import manufactoringsim
+
+    verbose, manufactoringsim.VERBOSE = manufactoringsim.VERBOSE, False
+    try:
+        stations = manufactoringsim.run_simulation(simpy.Environment(), len(error_rates), error_rates,
+                                                   horizon, refill_policy=refill_policy, crew_size=crew_size,
+                                                   params=params, seed=seed)
+    finally:
+        manufactoringsim.VERBOSE = verbose
+    registry = stations[0].registry
+    return {
+        "production": registry.view("production").astype(float),
+        "rejected": registry.view("rejected").astype(float),
+        "downtime": registry.view("downtime").copy(),
+        "total_production": registry.view("production").sum(),
+        "total_rejected": registry.view("rejected").sum(),
+        "source": "simulation",
+    }
+
+def print_what_if_report(result):
+    surrogate = result["source"] == "surrogate"
+    rows = []
+    for i, production in enumerate(result["production"]):
+        row = [f"Work Station {i + 1}", f"{production:.1f}", f"{result['rejected'][i]:.1f}",
+               f"{result['downtime'][i]:.1f}"]
+        if surrogate:
+            row.insert(2, f"± {1.96 * result['production_se'][i]:.1f}")
+        rows.append(row)
+    headers = ["Station", "Production", "Rejected", "Downtime"]
+    if surrogate:
+        headers.insert(2, "95% Half-Width")
+    print(tabulate(rows, headers=headers))
+    if surrogate:
+        half_width = 1.96 * result["total_production_se"] + result["model_error"]
+        print(f"\nTotal production {result['total_production']:.1f} ± {half_width:.1f} from the queueing "
+              f"approximation (refill utilization {result['refill_utilization']:.2f}, "
+              f"model error {result['model_error']:.1f} included)")
+    else:
+        print(f"\nTotal production {result['total_production']:.0f} from one simulation run")
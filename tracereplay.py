@@ -0,0 +1,224 @@
+import collections
+import csv
+import os
+import queue
+import random
+import threading
+
+import numpy as np
+
+from manufactoringsim import run_simulation, stream_seed
+
+# Recorded durations per station: processing times, repair times and the uptime between failures
+TRACE_KINDS = ("work", "repair", "uptime")
+READ_AHEAD_CHUNK = 1 << 16
+EMPIRICAL_BINS = 256
+EMPIRICAL_BATCH = 4096
+
+def trace_path(directory, station, kind):
+    return os.path.join(directory, f"{kind}-{station}.npy")
+
+def write_trace(directory, station, kind, durations):
+    os.makedirs(directory, exist_ok=True)
+    np.save(trace_path(directory, station, kind), np.asarray(durations, dtype=np.float64))
+
+def import_log(path, directory):
+    # A plant log with station, kind and duration columns, one row per recorded duration
+    durations = collections.defaultdict(list)
+    with open(path, newline="") as file:
+        for row in csv.DictReader(file):
+            if row["kind"] not in TRACE_KINDS:
+                raise ValueError(f"unknown trace kind {row['kind']!r}, expected one of {', '.join(TRACE_KINDS)}")
+            durations[int(row["station"]), row["kind"]].append(float(row["duration"]))
+    for (station, kind), values in durations.items():
+        write_trace(directory, station, kind, values)
+    return sorted({station for station, _ in durations})
+
+def trace_stations(directory):
+    stations = set()
+    for name in os.listdir(directory):
+        kind, _, rest = name.partition("-")
+        if kind in TRACE_KINDS and rest.endswith(".npy"):
+            stations.add(int(rest[:-len(".npy")]))
+    return sorted(stations)
+
+def trace_length(directory, station, kind):
+    path = trace_path(directory, station, kind)
+    return len(np.load(path, mmap_mode="r")) if os.path.exists(path) else 0
+
+class TraceReader(object):
+    # Streams a memory-mapped trace in order. A daemon thread copies the next chunks out of
+    # the mapping while the simulation consumes the current one, so page faults on a cold
+    # file are taken off the simulation thread. Wraps around at the end unless loop is off,
+    # close() stops the thread
+    def __init__(self, path, chunk=READ_AHEAD_CHUNK, loop=True, read_ahead=2):
+        self.path = path
+        self.data = np.load(path, mmap_mode="r")
+        if len(self.data) == 0:
+            raise ValueError(f"{path} has no recorded durations")
+        self.chunk = chunk
+        self.loop = loop
+        self.passes = 0
+        self.draws = 0
+        self._chunks = queue.Queue(maxsize=read_ahead)
+        self._current = []
+        self._index = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._read_ahead, daemon=True)
+        self._thread.start()
+
+    def _read_ahead(self):
+        position = 0
+        while not self._stop.is_set():
+            if position >= len(self.data):
+                self._put(None)
+                if not self.loop:
+                    return
+                position = 0
+            self._put(np.array(self.data[position:position + self.chunk]).tolist())
+            position += self.chunk
+
+    def _put(self, chunk):
+        # Blocks while the simulation is behind, gives up as soon as the reader is closed
+        while not self._stop.is_set():
+            try:
+                self._chunks.put(chunk, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def close(self):
+        self._stop.set()
+        # Making room wakes a read-ahead blocked on a full queue
+        while not self._chunks.empty():
+            self._chunks.get_nowait()
+        self._thread.join()
+
+    def next(self):
+        if self._index == len(self._current):
+            chunk = self._chunks.get()
+            if chunk is None:
+                self.passes += 1
+                if not self.loop:
+                    raise EOFError(f"{self.path} ran out of recorded durations")
+                chunk = self._chunks.get()
+            self._current = chunk
+            self._index = 0
+        value = self._current[self._index]
+        self._index += 1
+        self.draws += 1
+        return value
+
+class EmpiricalDistribution(object):
+    # Histogram of the recorded durations, sampled with Walker's alias method: one uniform
+    # picks a bin, a second accepts it or takes its alias, a third places the value in the bin.
+    # Draws are made in vectorized batches and handed out one at a time
+    def __init__(self, durations, bins=EMPIRICAL_BINS, seed=None):
+        counts, self.edges = np.histogram(np.asarray(durations), bins=bins)
+        self.probability, self.alias = alias_table(counts / counts.sum())
+        self.rng = np.random.default_rng(seed)
+        self.draws = 0
+        self._batch = []
+        self._index = 0
+
+    def sample(self, size):
+        bins = self.rng.integers(len(self.alias), size=size)
+        bins = np.where(self.rng.random(size) < self.probability[bins], bins, self.alias[bins])
+        low = self.edges[bins]
+        return low + self.rng.random(size) * (self.edges[bins + 1] - low)
+
+    def next(self):
+        if self._index == len(self._batch):
+            self._batch = self.sample(EMPIRICAL_BATCH).tolist()
+            self._index = 0
+        value = self._batch[self._index]
+        self._index += 1
+        self.draws += 1
+        return value
+
+def alias_table(probabilities):
+    # Vose's construction, O(n) for n bins
+    n = len(probabilities)
+    scaled = np.asarray(probabilities, dtype=float) * n
+    probability = np.ones(n)
+    alias = np.arange(n)
+    small = [i for i in range(n) if scaled[i] < 1]
+    large = [i for i in range(n) if scaled[i] >= 1]
+    while small and large:
+        less, more = small.pop(), large.pop()
+        probability[less] = scaled[less]
+        alias[less] = more
+        scaled[more] -= 1 - scaled[less]
+        (small if scaled[more] < 1 else large).append(more)
+    return probability, alias
+
+class TraceRandom(random.Random):
+    # Plugs recorded durations into the rng hook of WorkStation and failures(): normalvariate
+    # returns the next value of `normal` (processing times), expovariate the next value of
+    # `exponential` (repair or uptime). random() stays a seeded stream for the rejection and
+    # per item failure checks. Without a source the usual distribution is drawn
+    def __init__(self, seed, normal=None, exponential=None):
+        super().__init__(seed)
+        self.normal = normal
+        self.exponential = exponential
+
+    def normalvariate(self, mu=0.0, sigma=1.0):
+        if self.normal is None:
+            return super().normalvariate(mu, sigma)
+        return self.normal.next()
+
+    def expovariate(self, lambd=1.0):
+        if self.exponential is None:
+            return super().expovariate(lambd)
+        return self.exponential.next()
+
+def trace_sources(directory, stations, mode="replay", seed=None):
+    # {(station, kind): source} for every trace on disk, replayed in order or resampled
+    sources = {}
+    for station in stations:
+        for kind in TRACE_KINDS:
+            path = trace_path(directory, station, kind)
+            if not os.path.exists(path):
+                continue
+            if mode == "empirical":
+                sources[station, kind] = EmpiricalDistribution(np.load(path, mmap_mode="r"),
+                                                               seed=stream_seed(seed, "empirical", kind, station))
+            else:
+                sources[station, kind] = TraceReader(path)
+    return sources
+
+def run_replay(env, directory, num_runs, mode="replay", refill_policy="fifo", crew_size=None, params=None,
+               seed=None):
+    # Stations run on their recorded work and repair times. A station with an uptime trace is
+    # broken down by its recorded failures, interrupting it like a maintenance crew's. The others
+    # fail per item at the recorded share of items that needed a repair. Returns the stations and
+    # the (station, kind) traces the run never drew from
+    if seed is None:
+        seed = random.getrandbits(64)
+    stations = trace_stations(directory)
+    if stations != list(range(1, len(stations) + 1)):
+        raise ValueError(f"{directory} must hold traces for stations 1 to {len(stations)}")
+    sources = trace_sources(directory, stations, mode, seed)
+    error_rates = []
+    failure_means = {}
+    for station in stations:
+        items = trace_length(directory, station, "work")
+        error_rates.append(trace_length(directory, station, "repair") / items if items else 0.0)
+        if (station, "uptime") in sources:
+            failure_means[station] = float(np.load(trace_path(directory, station, "uptime"), mmap_mode="r").mean())
+
+    def streams(name, station):
+        if name == "failures":
+            return TraceRandom(stream_seed(seed, name, station), exponential=sources.get((station, "uptime")))
+        return TraceRandom(stream_seed(seed, name, station), normal=sources.get((station, "work")),
+                           exponential=sources.get((station, "repair")))
+
+    try:
+        result = run_simulation(env, len(stations), error_rates, num_runs, refill_policy=refill_policy,
+                                crew_size=crew_size, params=params, seed=seed, streams=streams,
+                                failure_means=failure_means)
+    finally:
+        for source in sources.values():
+            if isinstance(source, TraceReader):
+                source.close()
+    return result, sorted(key for key, source in sources.items() if source.draws == 0)